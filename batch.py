@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+批量处理目录或通配符匹配到的所有PDF，并为每个文件输出机器可读的处理汇总。
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pdf_watermark_remove import (
+    check_for_watermarks, extreme_watermark_removal, result_cache_key,
+    get_watermark_keywords, set_watermark_keywords
+)
+from run_report import RunReport
+from result_cache import ResultCache
+from template_store import TemplateStore
+
+# 输出文件名后缀，与图形界面的默认输出文件名保持一致
+OUTPUT_SUFFIX = "_no_watermark"
+
+def collect_pdf_files(source):
+    """收集待处理的PDF：目录取其中所有 .pdf 文件，否则按通配符展开"""
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)
+                 if name.lower().endswith(".pdf")]
+    else:
+        paths = glob.glob(source, recursive=True)
+    return sorted(path for path in paths if os.path.isfile(path))
+
+def source_root(source):
+    """输入的根目录：目录即其本身，通配符取第一个含通配符的部分之前的路径"""
+    if os.path.isdir(source):
+        return source
+    parts = source.replace(os.sep, "/").split("/")
+    for i, part in enumerate(parts):
+        if glob.has_magic(part):
+            return "/".join(parts[:i]) or ("/" if source.startswith("/") else ".")
+    return os.path.dirname(source) or "."
+
+def output_path_for(input_path, root, output_dir):
+    """输出路径：保留输入相对于根目录的子目录，文件名加上 OUTPUT_SUFFIX"""
+    relative = os.path.relpath(input_path, root)
+    if relative.startswith(os.pardir):
+        relative = os.path.basename(input_path)
+    name = os.path.splitext(relative)[0]
+    return os.path.join(output_dir, name + OUTPUT_SUFFIX + ".pdf")
+
+def load_keywords_file(path):
+    """读取关键词文件，每行一个关键词"""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+def new_record(input_path):
+    """单个文件的初始处理记录"""
+    return {
+        "input": input_path,
+        "output": None,
+        "status": "processed",
+        "watermarks": 0,
+        "pages_with_watermarks": 0,
+        "pages_modified": 0,
+        "elapsed": 0.0,
+        "bytes_in": 0,
+        "bytes_out": 0,
+        "error": None,
+        "cached": False,
+        "run_report": None,
+    }
+
+def process_file(input_path, output_path, keywords, low_memory=False, template_path=None, cache_dir=None):
+    """检查并移除单个文件中的水印，返回该文件的处理记录
+
+    给出 template_path 时使用该位置的水印模板库；给出 cache_dir 时使用该
+    目录中的结果缓存，内容相同的文件直接复制上次的输出。
+    """
+    set_watermark_keywords(list(keywords))
+    record = new_record(input_path)
+    start = time.perf_counter()
+    template_store = None
+    try:
+        # 文件可能在收集之后被移走，读取大小也要记为该文件的错误
+        record["bytes_in"] = os.path.getsize(input_path)
+        if template_path is not None:
+            template_store = TemplateStore(template_path)
+        # 删除上次运行留下的输出，避免把旧文件当作本次结果
+        if os.path.exists(output_path):
+            os.remove(output_path)
+
+        result_cache = ResultCache(cache_dir) if cache_dir else None
+        cache_key = result_cache_key(result_cache, input_path, output_path, "batch", None,
+                                     template_store=template_store)
+        cached = result_cache.get(cache_key, output_path) if cache_key else None
+        if cached is not None:
+            record.update(cached)
+            record["cached"] = True
+            record["output"] = output_path
+            record["bytes_out"] = os.path.getsize(output_path)
+            record["elapsed"] = round(time.perf_counter() - start, 4)
+            return record
+
+        # 进程池中多个文件同时运行，屏蔽核心函数的逐页进度输出
+        check_report = RunReport("check")
+        remove_report = RunReport("remove")
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            watermarks, pages, _ = check_for_watermarks(input_path, run_report=check_report,
+                                                        low_memory=low_memory, template_store=template_store)
+            record["watermarks"] = watermarks
+            record["pages_with_watermarks"] = len(pages)
+            record["pages_modified"] = extreme_watermark_removal(input_path, output_path,
+                                                                 run_report=remove_report,
+                                                                 low_memory=low_memory,
+                                                                 template_store=template_store)
+        record["run_report"] = {"check": check_report.to_dict(), "remove": remove_report.to_dict()}
+
+        if os.path.exists(output_path):
+            record["output"] = output_path
+            record["bytes_out"] = os.path.getsize(output_path)
+            if cache_key:
+                result_cache.put(cache_key, output_path, {
+                    key: record[key] for key in ("watermarks", "pages_with_watermarks", "pages_modified")
+                })
+        else:
+            record["status"] = "error"
+            record["error"] = "未生成输出文件"
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = str(e)
+    finally:
+        if template_store is not None:
+            template_store.close()
+    record["elapsed"] = round(time.perf_counter() - start, 4)
+    return record
+
+def batch_remove_watermarks(source, output_dir, workers=None, summary_path=None, keywords=None,
+                            low_memory=False, template_path=None, cache_dir=None):
+    """批量移除水印
+
+    source 为目录或通配符，结果写入 output_dir，同时最多运行 workers 个进程。
+    汇总写入 summary_path（默认为 output_dir/summary.json），并作为返回值。
+    low_memory 为 True 时每个文件都以低内存模式处理，适合很大的文件。
+    template_path 为水印模板库的位置，所有进程共用，已知的水印按指纹识别。
+    cache_dir 为结果缓存目录，重复的输入直接复制缓存中的输出。
+    """
+    if keywords is None:
+        keywords = get_watermark_keywords()
+    if summary_path is None:
+        summary_path = os.path.join(output_dir, "summary.json")
+    os.makedirs(output_dir, exist_ok=True)
+
+    input_paths = collect_pdf_files(source)
+    print(f"找到 {len(input_paths)} 个PDF文件")
+
+    start = time.perf_counter()
+    records = []
+    root = source_root(source)
+    outputs = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for input_path in input_paths:
+            output_path = output_path_for(input_path, root, output_dir)
+            key = os.path.normcase(os.path.abspath(output_path))
+            if key in outputs:
+                # 两个输入对应同一个输出（如 x.pdf 与 x.PDF），不能互相覆盖
+                record = new_record(input_path)
+                record["status"] = "error"
+                record["error"] = f"输出路径与 {outputs[key]} 相同"
+                records.append(record)
+                print(f"输出路径冲突，跳过: {input_path}")
+                continue
+            outputs[key] = input_path
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            futures[executor.submit(process_file, input_path, output_path, tuple(keywords),
+                                    low_memory, template_path, cache_dir)] = input_path
+
+        for done, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            records.append(record)
+            print(f"[{done}/{len(futures)}] {record['status']}: {record['input']}")
+
+    records.sort(key=lambda record: record["input"])
+    summary = {
+        "source": source,
+        "output_dir": output_dir,
+        "workers": workers or os.cpu_count(),
+        "keywords": list(keywords),
+        "elapsed": round(time.perf_counter() - start, 4),
+        "files": records,
+    }
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    print(f"处理汇总已保存到: {summary_path}")
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="批量移除PDF文字水印")
+    parser.add_argument("source", help="PDF所在目录，或通配符（如 'inbox/**/*.pdf'）")
+    parser.add_argument("-o", "--output-dir", default="Output-pdf", help="输出目录")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="并发进程数，默认为CPU核数")
+    parser.add_argument("-k", "--keywords", help="关键词文件，每行一个关键词")
+    parser.add_argument("--summary", help="汇总JSON的保存路径，默认为输出目录下的 summary.json")
+    parser.add_argument("--low-memory", action="store_true",
+                        help="低内存模式：内存映射读取文件，不缓存解码数据，适合很大的文件")
+    parser.add_argument("--templates", help="水印模板库（SQLite）的路径，处理成功后自动积累模板")
+    parser.add_argument("--cache", help="结果缓存目录，内容相同的输入直接复用上次的输出")
+    args = parser.parse_args()
+
+    keywords = load_keywords_file(args.keywords) if args.keywords else None
+    summary = batch_remove_watermarks(args.source, args.output_dir, args.workers,
+                                      args.summary, keywords, args.low_memory, args.templates,
+                                      args.cache)
+    failed = [record for record in summary["files"] if record["status"] == "error"]
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
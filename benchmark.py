@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+性能基准：生成带水印的合成PDF，并测量水印处理各环节的耗时、峰值内存与磁盘读写量。
+
+    python benchmark.py --json bench.json suite --pages 500 --keywords 300
+    python benchmark.py clean --pages 500
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pikepdf
+from pikepdf import Name, Dictionary, Array
+
+from pdf_watermark_remove import (
+    check_for_watermarks, extreme_watermark_removal, create_clean_pdf,
+    remove_watermarks_pipeline, get_default_watermark_keywords, set_watermark_keywords
+)
+from run_report import RunReport
+
+# 合成PDF的水印形式：页面内容流中的文本块、共用的表单、/Contents 数组中单独的流、嵌套表单
+WATERMARK_STYLES = ("inline", "form", "array", "nested")
+
+# 被测的处理环节
+BENCH_STEPS = {
+    "check": lambda input_path, output_path, report: check_for_watermarks(input_path, run_report=report),
+    "remove": lambda input_path, output_path, report: extreme_watermark_removal(
+        input_path, output_path, run_report=report),
+    "remove-low-memory": lambda input_path, output_path, report: extreme_watermark_removal(
+        input_path, output_path, run_report=report, low_memory=True),
+    "pipeline": lambda input_path, output_path, report: remove_watermarks_pipeline(
+        input_path, output_path, run_report=report),
+    "clean": lambda input_path, output_path, report: create_clean_pdf(input_path, output_path, run_report=report),
+}
+
+def _make_form(pdf, content, resources):
+    return pdf.make_stream(
+        content, Type=Name.XObject, Subtype=Name.Form,
+        BBox=[0, 0, 612, 792], Resources=resources,
+    )
+
+def make_synthetic_pdf(path, pages=100, paragraphs=40, style="inline", watermark="Review Copy"):
+    """生成合成PDF：每页包含若干正文文本块和一处指定形式的水印
+
+    paragraphs 决定每页正文内容流的大小（每个文本块约 80 字节），
+    style 取值见 WATERMARK_STYLES。
+    """
+    if style not in WATERMARK_STYLES:
+        raise ValueError(f"未知的水印形式: {style}")
+    
+    pdf = pikepdf.new()
+    font = pdf.make_indirect(Dictionary(
+        Type=Name.Font, Subtype=Name.Type1, BaseFont=Name.Helvetica
+    ))
+    fonts = Dictionary(F1=font)
+    watermark_block = f"q 0.5 g BT /F1 48 Tf 0.7 0.7 -0.7 0.7 150 250 Tm ({watermark}) Tj ET Q"
+
+    resources = Dictionary(Font=fonts)
+    if style == "form":
+        resources.XObject = Dictionary(WM=_make_form(pdf, watermark_block.encode("latin-1"), Dictionary(Font=fonts)))
+    elif style == "nested":
+        inner = _make_form(pdf, watermark_block.encode("latin-1"), Dictionary(Font=fonts))
+        outer = _make_form(
+            pdf, b"q /Inner Do Q BT /F1 9 Tf 72 30 Td (Chapter footer) Tj ET",
+            Dictionary(Font=fonts, XObject=Dictionary(Inner=inner)),
+        )
+        resources.XObject = Dictionary(Outer=outer)
+    resources = pdf.make_indirect(resources)
+
+    for page_index in range(pages):
+        parts = []
+        for line in range(paragraphs):
+            y = 760 - line * 18
+            parts.append(
+                f"BT /F1 11 Tf 72 {y} Td (Page {page_index + 1} line {line}: "
+                f"The quick brown fox jumps over the lazy dog.) Tj ET"
+            )
+        if style == "inline":
+            parts.append(watermark_block)
+        elif style == "form":
+            parts.append("q /WM Do Q")
+        elif style == "nested":
+            parts.append("q /Outer Do Q")
+        contents = pdf.make_stream("\n".join(parts).encode("latin-1"))
+        if style == "array":
+            contents = Array([contents, pdf.make_stream(watermark_block.encode("latin-1"))])
+        
+        page = Dictionary(
+            Type=Name.Page, MediaBox=[0, 0, 612, 792],
+            Resources=resources, Contents=contents,
+        )
+        pdf.pages.append(pikepdf.Page(page))
+
+    pdf.save(path, compress_streams=True)
+    return path
+
+def benchmark_keywords(count):
+    """默认关键词加上填充用的出版社短语，共 count 个"""
+    keywords = list(get_default_watermark_keywords())
+    for index in range(len(keywords), count):
+        keywords.append(f"Publisher Phrase {index:04d}")
+    return keywords[:max(count, 1)]
+
+def read_process_io():
+    """读取当前进程累计的读写字节数（Linux /proc/self/io），其他平台返回 None"""
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(":") for line in f)
+    except OSError:
+        return None
+    return {"read": int(fields["rchar"]), "written": int(fields["wchar"])}
+
+def measure(func, *args):
+    """运行一次 func，返回耗时和期间的进程读写字节数"""
+    io_before = read_process_io()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        func(*args)
+    elapsed = time.perf_counter() - start
+    io_after = read_process_io()
+
+    result = {"seconds": round(elapsed, 4)}
+    if io_before and io_after:
+        result["bytes_read"] = io_after["read"] - io_before["read"]
+        result["bytes_written"] = io_after["written"] - io_before["written"]
+    return result
+
+def legacy_create_clean_pdf(input_path, output_path):
+    """旧的重建流程：先写出完整的临时PDF，再重新打开并复制页面，作为对照"""
+    temp_path = output_path + ".temp.pdf"
+    extreme_watermark_removal(input_path, temp_path)
+    create_clean_pdf(temp_path, output_path)
+    os.remove(temp_path)
+
+# 对比的两种重建流程
+CLEAN_METHODS = {
+    "temp_file": legacy_create_clean_pdf,
+    "in_memory": create_clean_pdf,
+}
+
+def _measure_clean(method, input_path, output_path):
+    """在独立子进程中测量一种重建流程，解码流缓存等进程内状态不会从上一次测量中继承"""
+    return measure(CLEAN_METHODS[method], input_path, output_path)
+
+def bench_clean(pages, paragraphs):
+    """对比重建流程使用临时文件与直接在内存中进行时的耗时和磁盘读写"""
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as workdir:
+        input_path = make_synthetic_pdf(os.path.join(workdir, "input.pdf"), pages, paragraphs)
+        output_path = os.path.join(workdir, "output.pdf")
+        timings = {}
+        for method in CLEAN_METHODS:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                timings[method] = executor.submit(_measure_clean, method, input_path, output_path).result()
+        return {
+            "pages": pages,
+            "input_bytes": os.path.getsize(input_path),
+            "output_bytes": os.path.getsize(output_path),
+            **timings,
+        }
+
+def _run_step(step, input_path, output_path, keywords):
+    """在独立子进程中运行一个处理环节，返回耗时、进程峰值内存和各阶段耗时"""
+    import resource
+
+    set_watermark_keywords(keywords)
+    report = RunReport(step)
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        BENCH_STEPS[step](input_path, output_path, report)
+    elapsed = time.perf_counter() - start
+    # Linux 上 ru_maxrss 的单位是 KB
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return elapsed, peak_rss, report.to_dict()
+
+def bench_startup(runs):
+    """测量命令行入口的启动耗时：每条命令在新进程中运行 runs 次，取中位数"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    cli = os.path.join(here, "cli.py")
+    with tempfile.TemporaryDirectory() as workdir:
+        sample = make_synthetic_pdf(os.path.join(workdir, "sample.pdf"), pages=1, paragraphs=5)
+        commands = {
+            "python": [sys.executable, "-c", "pass"],
+            "import_core": [sys.executable, "-c", "import pdf_watermark_remove"],
+            "cli_help": [sys.executable, cli, "--help"],
+            "cli_check_1_page": [sys.executable, cli, "--check", "-q", sample],
+        }
+        results = {}
+        for name, command in commands.items():
+            timings = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                subprocess.run(command, cwd=here, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            results[name] = round(timings[len(timings) // 2] * 1000, 1)
+            print(f"{name:>18}: {results[name]} ms", file=sys.stderr)
+    return {"runs": runs, "median_ms": results}
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def bench_suite(pages, paragraphs, keyword_count, styles, steps, repeat):
+    """对每种水印形式生成合成PDF，测量各处理环节的吞吐量、峰值内存和输出大小
+
+    每次测量都在新的子进程中进行，峰值内存互不影响，也不会命中上一次
+    测量留下的缓存；repeat 次测量中取最快的一次。
+    """
+    keywords = benchmark_keywords(keyword_count)
+    context = multiprocessing.get_context("spawn")
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for style in styles:
+            input_path = make_synthetic_pdf(
+                os.path.join(workdir, f"{style}.pdf"), pages, paragraphs, style
+            )
+            for step in steps:
+                output_path = os.path.join(workdir, f"{style}-{step}.pdf")
+                runs = []
+                for _ in range(repeat):
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                        runs.append(executor.submit(_run_step, step, input_path, output_path, keywords).result())
+                elapsed, peak_rss, run_report = min(runs, key=lambda run: run[0])
+                record = {
+                    "style": style,
+                    "step": step,
+                    "seconds": round(elapsed, 4),
+                    "pages_per_sec": round(pages / elapsed, 1) if elapsed else None,
+                    "peak_rss_mb": round(peak_rss / (1024 * 1024), 1),
+                    "input_bytes": os.path.getsize(input_path),
+                    "output_bytes": os.path.getsize(output_path) if os.path.exists(output_path) else None,
+                    "stages": run_report["stages"],
+                    "page_latency": run_report["page_latency"],
+                }
+                results.append(record)
+                print(f"{style:>7} {step:>8}: {record['seconds']:8.3f}s "
+                      f"{record['pages_per_sec']:>9} 页/秒  峰值内存 {record['peak_rss_mb']} MB",
+                      file=sys.stderr)
+
+    return {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "pikepdf": pikepdf.__version__,
+        "platform": platform.platform(),
+        "pages": pages,
+        "paragraphs": paragraphs,
+        "keywords": len(keywords),
+        "results": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF水印移除性能基准")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    clean_parser = subparsers.add_parser("clean", help="对比 create_clean_pdf 使用临时文件与内存重建的读写量")
+    clean_parser.add_argument("--pages", type=int, default=500)
+    clean_parser.add_argument("--paragraphs", type=int, default=40, help="每页正文文本块数")
+
+    suite_parser = subparsers.add_parser("suite", help="测量各种水印形式下检查、移除和重建的性能")
+    suite_parser.add_argument("--pages", type=int, default=200)
+    suite_parser.add_argument("--paragraphs", type=int, default=40, help="每页正文文本块数，决定内容流大小")
+    suite_parser.add_argument("--keywords", type=int, default=5, help="加载的关键词数量")
+    suite_parser.add_argument("--styles", nargs="+", choices=WATERMARK_STYLES, default=list(WATERMARK_STYLES))
+    suite_parser.add_argument("--steps", nargs="+", choices=list(BENCH_STEPS), default=list(BENCH_STEPS))
+    suite_parser.add_argument("--repeat", type=int, default=1, help="每项测量的重复次数，取最快的一次")
+
+    startup_parser = subparsers.add_parser("startup", help="测量命令行入口的启动耗时")
+    startup_parser.add_argument("--runs", type=int, default=20, help="每条命令的运行次数")
+
+    parser.add_argument("--json", help="把结果保存为JSON文件")
+    args = parser.parse_args()
+
+    if args.command == "clean":
+        result = bench_clean(args.pages, args.paragraphs)
+    elif args.command == "suite":
+        result = bench_suite(args.pages, args.paragraphs, args.keywords,
+                             args.styles, args.steps, args.repeat)
+    elif args.command == "startup":
+        result = bench_startup(args.runs)
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    sys.exit(main())
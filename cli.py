@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+命令行入口：不依赖图形界面，支持标准输入输出管道、关键词文件和JSON报告。
+
+    python cli.py input.pdf -o output.pdf --report report.json
+    cat input.pdf | python cli.py - -o - > output.pdf
+    python cli.py --check input.pdf
+    python cli.py --quick --sample-size 20 input.pdf
+
+处理模块（及其依赖的 pikepdf）只在真正处理文件时才导入，--help 和参数错误
+都不需要加载它们。
+"""
+
+import os
+import sys
+import argparse
+
+# 命令行的退出码：--check 发现水印时返回 EXIT_WATERMARKS_FOUND
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_WATERMARKS_FOUND = 2
+
+# 默认输出文件名后缀，与图形界面和批量处理保持一致
+OUTPUT_SUFFIX = "_no_watermark"
+
+# --quick 默认抽样的页数，与 pdf_watermark_remove.QUICK_CHECK_SAMPLE 一致
+QUICK_SAMPLE_SIZE = 20
+
+def positive_int(value):
+    """argparse 参数类型：大于 0 的整数"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"必须大于 0: {value}")
+    return number
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="移除PDF中的文字水印",
+        epilog="--check 和 --quick 模式下未发现水印时退出码为 0，发现水印时为 2，出错时为 1。",
+    )
+    parser.add_argument("input", help="输入PDF，'-' 表示从标准输入读取")
+    parser.add_argument("-o", "--output",
+                        help="输出PDF，'-' 表示写到标准输出；默认为输入文件名加 _no_watermark")
+    parser.add_argument("-k", "--keywords", help="关键词文件，每行一个关键词")
+    parser.add_argument("--keyword", action="append", default=[], help="水印关键词，可以重复给出")
+    parser.add_argument("--report", help="把JSON处理报告写到该文件，'-' 表示写到标准错误")
+    parser.add_argument("--check", action="store_true", help="只检查水印，不写出PDF")
+    parser.add_argument("--quick", action="store_true", help="抽样检查水印，发现水印即停止，不写出PDF")
+    parser.add_argument("--sample-size", type=positive_int, default=QUICK_SAMPLE_SIZE, metavar="PAGES",
+                        help=f"--quick 最多检查的页数，默认 {QUICK_SAMPLE_SIZE}")
+    parser.add_argument("--sample", choices=("first", "stride", "random"), default="stride",
+                        help="--quick 的抽样方式：前几页、等间隔或随机，默认等间隔")
+    parser.add_argument("--seed", type=int, help="--sample random 的随机种子")
+    parser.add_argument("--full-sample", action="store_true",
+                        help="--quick 发现水印后继续检查全部抽样页，用于估计有水印的页数")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="并行处理页面的进程数")
+    parser.add_argument("--low-memory", action="store_true", help="低内存模式，适合很大的文件")
+    parser.add_argument("--repeated", type=float, metavar="FRACTION",
+                        help="同时移除出现在超过该比例页面上的重复内容")
+    parser.add_argument("--layers", choices=("hide", "strip", "ignore"), default="hide",
+                        help="水印图层的处理方式：在图层配置中关闭（默认）、同时删除图层内容，或不处理")
+    parser.add_argument("--layers-only", action="store_true",
+                        help="只关闭水印图层，不解析页面内容，耗时与页数无关")
+    parser.add_argument("--templates", help="水印模板库（SQLite）的路径")
+    parser.add_argument("--cache", help="结果缓存目录")
+    parser.add_argument("-q", "--quiet", action="store_true", help="不输出进度信息")
+    return parser
+
+def resolve_keywords(args):
+    """关键词文件和 --keyword 合并；都没有给出时返回 None，使用默认关键词"""
+    keywords = []
+    if args.keywords:
+        with open(args.keywords, encoding="utf-8") as f:
+            keywords.extend(line.strip() for line in f if line.strip())
+    keywords.extend(args.keyword)
+    return keywords or None
+
+def default_output_path(input_path):
+    if input_path == "-":
+        return "-"
+    return os.path.splitext(input_path)[0] + OUTPUT_SUFFIX + ".pdf"
+
+def write_report(report, path):
+    import json
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if path == "-":
+        print(text, file=sys.stderr)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+def run_check(source, args):
+    from pdf_watermark_remove import (open_pdf, iter_watermark_check, console_progress, find_watermark_layers,
+                                      get_keyword_matcher, layer_names)
+
+    pages = {}
+    with open_pdf(source, low_memory=args.low_memory) as pdf:
+        layers = layer_names(find_watermark_layers(pdf, get_keyword_matcher()))
+        for record in iter_watermark_check(pdf, console_progress("检查页面"), low_memory=args.low_memory):
+            if record["count"] > 0:
+                pages[str(record["page"])] = record["details"]
+    # 每个水印图层计为一处水印
+    total = sum(sum(details.values()) for details in pages.values()) + len(layers)
+    if layers:
+        print(f"\n发现水印图层: {', '.join(layers)}")
+    print(f"\n发现 {total} 处水印，在 {len(pages)} 个页面")
+    report = {
+        "watermarks": total,
+        "pages_with_watermarks": [int(page) for page in pages],
+        "watermark_layers": layers,
+        "pages": pages,
+    }
+    return report, EXIT_WATERMARKS_FOUND if total else EXIT_OK
+
+def run_quick_check(source, args):
+    from pdf_watermark_remove import quick_check_watermarks
+
+    report = quick_check_watermarks(source, sample_size=args.sample_size, strategy=args.sample, seed=args.seed,
+                                    stop_on_hit=not args.full_sample)
+    low, high = report["interval"]
+    if report["watermark_layers"]:
+        print(f"发现水印图层: {', '.join(report['watermark_layers'])}")
+    if report["has_watermarks"]:
+        print(f"发现水印（检查了 {report['pages_scanned']}/{report['total_pages']} 页）")
+        if not report["stopped_early"]:
+            print(f"估计有水印的页数: {report['estimated_pages']}（{low}-{high}）")
+    else:
+        print(f"抽样 {report['pages_scanned']}/{report['total_pages']} 页未发现水印，"
+              f"检出概率 {report['detection_confidence']:.4f}")
+    return report, EXIT_WATERMARKS_FOUND if report["has_watermarks"] else EXIT_OK
+
+def run_layer_removal(source, output, args):
+    from pdf_watermark_remove import remove_watermark_layers
+    from run_report import RunReport
+
+    run_report = RunReport(args.input)
+    layers = remove_watermark_layers(source, output, run_report=run_report)
+    if layers is None:
+        return None, EXIT_ERROR
+    return {"watermark_layers": layers, "run": run_report.to_dict()}, EXIT_OK
+
+def run_removal(source, output, args):
+    from pdf_watermark_remove import remove_watermarks_pipeline
+    from run_report import RunReport
+
+    options = {}
+    if args.templates:
+        from template_store import TemplateStore
+        options["template_store"] = TemplateStore(args.templates)
+    if args.cache:
+        from result_cache import ResultCache
+        options["result_cache"] = ResultCache(args.cache)
+
+    run_report = RunReport(args.input)
+    report = remove_watermarks_pipeline(
+        source, output, workers=args.workers, run_report=run_report, low_memory=args.low_memory,
+        repeated_fraction=args.repeated, watermark_layers=None if args.layers == "ignore" else args.layers,
+        **options
+    )
+    if "template_store" in options:
+        options["template_store"].close()
+    if report is None:
+        return None, EXIT_ERROR
+    report["run"] = run_report.to_dict()
+    return report, EXIT_OK
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    output_path = args.output or default_output_path(args.input)
+
+    import io
+    import contextlib
+
+    # 标准输出可能用于输出PDF，处理过程中的提示信息一律写到标准错误
+    status = open(os.devnull, "w") if args.quiet else sys.stderr
+    try:
+        keywords = resolve_keywords(args)
+        if keywords is not None:
+            from pdf_watermark_remove import set_watermark_keywords
+            set_watermark_keywords(keywords)
+
+        source = io.BytesIO(sys.stdin.buffer.read()) if args.input == "-" else args.input
+        with contextlib.redirect_stdout(status):
+            if args.quick:
+                report, exit_code = run_quick_check(source, args)
+            elif args.check:
+                report, exit_code = run_check(source, args)
+            else:
+                output = io.BytesIO() if output_path == "-" else output_path
+                if args.layers_only:
+                    report, exit_code = run_layer_removal(source, output, args)
+                else:
+                    report, exit_code = run_removal(source, output, args)
+        if not (args.check or args.quick) and report is not None and output_path == "-":
+            sys.stdout.buffer.write(output.getvalue())
+            sys.stdout.buffer.flush()
+    except Exception as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        if args.quiet:
+            status.close()
+
+    if report is not None and args.report:
+        write_report(report, args.report)
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
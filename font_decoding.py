@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+字体感知的文本解码：按字体的 /ToUnicode CMap 或 /Encoding 把显示文本的字符串解码为 Unicode。
+"""
+
+import re
+import logging
+import pikepdf
+
+logger = logging.getLogger("pdf_watermark_remove")
+
+# 单字节字体的基础编码对应的 Python 编解码器；StandardEncoding 与 Latin-1
+# 只在少数标点上不同，不影响字母和数字
+BASE_ENCODINGS = {
+    "/WinAnsiEncoding": "cp1252",
+    "/MacRomanEncoding": "mac_roman",
+    "/StandardEncoding": "latin-1",
+    "/PDFDocEncoding": "latin-1",
+}
+
+# bfrange 中不超过该长度的范围展开为逐个编码的映射，更长的范围按区间查找
+CMAP_RANGE_EXPAND = 256
+
+# /Differences 中常见的字形名称（Adobe Glyph List 的子集）；单个字母、
+# uniXXXX 和 uXXXX 形式的名称按规则转换，不需要列出
+GLYPH_NAMES = {
+    "space": " ", "exclam": "!", "quotedbl": '"', "numbersign": "#", "dollar": "$",
+    "percent": "%", "ampersand": "&", "quotesingle": "'", "parenleft": "(", "parenright": ")",
+    "asterisk": "*", "plus": "+", "comma": ",", "hyphen": "-", "period": ".", "slash": "/",
+    "zero": "0", "one": "1", "two": "2", "three": "3", "four": "4",
+    "five": "5", "six": "6", "seven": "7", "eight": "8", "nine": "9",
+    "colon": ":", "semicolon": ";", "less": "<", "equal": "=", "greater": ">", "question": "?",
+    "at": "@", "bracketleft": "[", "backslash": "\\", "bracketright": "]", "asciicircum": "^",
+    "underscore": "_", "grave": "`", "braceleft": "{", "bar": "|", "braceright": "}",
+    "asciitilde": "~", "quoteleft": "‘", "quoteright": "’", "quotedblleft": "“",
+    "quotedblright": "”", "endash": "–", "emdash": "—", "bullet": "•",
+    "ellipsis": "…", "copyright": "©", "registered": "®", "trademark": "™",
+    "nbspace": " ", "minus": "−", "fi": "fi", "fl": "fl", "ff": "ff", "ffi": "ffi", "ffl": "ffl",
+}
+
+_SECTION = re.compile(rb"begin(codespacerange|bfchar|bfrange)(.*?)end\1", re.S)
+_TOKEN = re.compile(rb"<([^>]*)>|(\[)|(\])|/([^\s/<>\[\]()]+)")
+
+def glyph_name_to_text(name):
+    """把字形名称转换为文本，无法识别时返回空字符串"""
+    name = name.lstrip("/").split(".")[0]
+    if "_" in name:
+        return "".join(glyph_name_to_text(part) for part in name.split("_"))
+    if name in GLYPH_NAMES:
+        return GLYPH_NAMES[name]
+    if len(name) == 1:
+        return name
+    try:
+        if name.startswith("uni") and len(name) >= 7 and (len(name) - 3) % 4 == 0:
+            return "".join(chr(int(name[i:i + 4], 16)) for i in range(3, len(name), 4))
+        if name.startswith("u") and 5 <= len(name) <= 7:
+            return chr(int(name[1:], 16))
+    except ValueError:
+        pass
+    return ""
+
+def _hex_bytes(token):
+    digits = re.sub(rb"\s", b"", token)
+    if len(digits) % 2:
+        # 奇数位的十六进制串末尾补 0
+        digits += b"0"
+    return bytes.fromhex(digits.decode("ascii"))
+
+def _utf16(data):
+    return data.decode("utf-16-be", errors="replace")
+
+def parse_cmap(data):
+    """解析 ToUnicode CMap
+
+    返回 (codespace, chars, ranges)：codespace 为 [(下限字节, 上限字节), ...]，
+    chars 为 {编码字节: 文本}，ranges 为 [(编码长度, 起始编码, 结束编码,
+    起始目标字节), ...]，只包含超过 CMAP_RANGE_EXPAND 的 bfrange。
+    """
+    codespace = []
+    chars = {}
+    ranges = []
+    for section in _SECTION.finditer(data):
+        kind = section.group(1)
+        tokens = []
+        array = None
+        for match in _TOKEN.finditer(section.group(2)):
+            hex_token, open_array, close_array, name = match.groups()
+            if open_array:
+                array = []
+            elif close_array:
+                tokens.append(array or [])
+                array = None
+            else:
+                value = _hex_bytes(hex_token) if hex_token is not None else glyph_name_to_text(name.decode("latin-1"))
+                if array is not None:
+                    array.append(value)
+                else:
+                    tokens.append(value)
+
+        if kind == b"codespacerange":
+            codespace.extend(zip(tokens[0::2], tokens[1::2]))
+        elif kind == b"bfchar":
+            for source, target in zip(tokens[0::2], tokens[1::2]):
+                chars[source] = _utf16(target) if isinstance(target, bytes) else target
+        else:
+            for low, high, target in zip(tokens[0::3], tokens[1::3], tokens[2::3]):
+                length = len(low)
+                start, stop = int.from_bytes(low, "big"), int.from_bytes(high, "big")
+                if isinstance(target, list):
+                    for offset, item in enumerate(target[:stop - start + 1]):
+                        code = (start + offset).to_bytes(length, "big")
+                        chars[code] = _utf16(item) if isinstance(item, bytes) else item
+                elif stop - start < CMAP_RANGE_EXPAND:
+                    base = int.from_bytes(target, "big")
+                    for offset in range(stop - start + 1):
+                        code = (start + offset).to_bytes(length, "big")
+                        chars[code] = _utf16((base + offset).to_bytes(len(target), "big"))
+                else:
+                    ranges.append((length, start, stop, target))
+    return codespace, chars, ranges
+
+def decode_unknown(data):
+    """没有字体信息时的解码：按 UTF-8 解码，失败时按 Latin-1 逐字节解码"""
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")
+
+class FontDecoder:
+    """一个字体的解码器：把显示文本的字符串（字符编码）转换为 Unicode 文本
+
+    code_length 为固定的编码字节数；为 None 时按 codespace 逐个确定编码长度。
+    chars 和 ranges 来自 ToUnicode CMap，single_byte 为单字节编码的后备映射
+    （由 /Encoding 得到），未映射的编码按 fallback 处理。
+    """
+
+    def __init__(self, code_length=1, codespace=(), chars=None, ranges=(), single_byte=None, fallback=None):
+        self.code_length = code_length
+        self.codespace = [(low, high) for low, high in codespace]
+        self.lengths = sorted({len(low) for low, _ in self.codespace}) or [code_length or 1]
+        self.chars = chars or {}
+        self.ranges = list(ranges)
+        self.single_byte = single_byte
+        self.fallback = fallback
+
+    def _in_codespace(self, code):
+        for low, high in self.codespace:
+            if len(low) == len(code) and all(l <= c <= h for l, c, h in zip(low, code, high)):
+                return True
+        return False
+
+    def _codes(self, data):
+        if self.code_length is not None:
+            step = self.code_length
+            for i in range(0, len(data), step):
+                yield data[i:i + step]
+            return
+        i = 0
+        while i < len(data):
+            for length in self.lengths:
+                code = data[i:i + length]
+                if len(code) == length and self._in_codespace(code):
+                    break
+            else:
+                code = data[i:i + self.lengths[0]]
+            yield code
+            i += len(code)
+
+    def _lookup(self, code):
+        text = self.chars.get(code)
+        if text is not None:
+            return text
+        value = int.from_bytes(code, "big")
+        for length, start, stop, target in self.ranges:
+            if length == len(code) and start <= value <= stop:
+                base = int.from_bytes(target, "big") + value - start
+                return _utf16(base.to_bytes(len(target), "big"))
+        if self.single_byte is not None and len(code) == 1:
+            return self.single_byte[code[0]]
+        return self.fallback(code) if self.fallback is not None else ""
+
+    def decode(self, data):
+        if not self.chars and not self.ranges:
+            if self.single_byte is not None:
+                return "".join(self.single_byte[byte] for byte in data)
+            if self.fallback is not None:
+                return self.fallback(data)
+        return "".join(self._lookup(code) for code in self._codes(data))
+
+class _UnknownFontDecoder:
+    """没有字体或无法解析字体时使用"""
+
+    def decode(self, data):
+        return decode_unknown(data)
+
+UNKNOWN_FONT = _UnknownFontDecoder()
+
+def _codec_decoder(codec):
+    return lambda data: data.decode(codec, errors="replace")
+
+def single_byte_table(encoding):
+    """由简单字体的 /Encoding 建立 256 项的编码 -> 文本表，无法确定编码时返回 None"""
+    base = encoding
+    differences = None
+    if isinstance(encoding, pikepdf.Dictionary):
+        base = encoding.get("/BaseEncoding")
+        differences = encoding.get("/Differences")
+    base = str(base) if isinstance(base, pikepdf.Name) else None
+    if base not in BASE_ENCODINGS and differences is None:
+        return None
+
+    codec = BASE_ENCODINGS.get(base, "latin-1")
+    table = []
+    for code in range(256):
+        try:
+            table.append(bytes([code]).decode(codec))
+        except UnicodeDecodeError:
+            table.append(chr(code))
+    if differences is not None:
+        code = 0
+        for item in differences:
+            if isinstance(item, int):
+                code = item
+            else:
+                if 0 <= code < 256:
+                    table[code] = glyph_name_to_text(str(item))
+                code += 1
+    return table
+
+class FontCache:
+    """一个文档内的字体解码器缓存
+
+    解码器按字体对象的 objgen 缓存，每个字体只解析一次；多个字体共用的
+    ToUnicode CMap 按流的 objgen 缓存，同样只解析一次。read_bytes 为读取流
+    解码数据的函数（如 StreamReader.read_bytes），默认直接读取。
+    """
+
+    def __init__(self, read_bytes=None):
+        self.read_bytes = read_bytes or (lambda stream: stream.read_bytes())
+        self.decoders = {}
+        self.cmaps = {}
+        self.fonts_parsed = 0
+
+    def decoder_for(self, font):
+        """返回字体字典对应的 FontDecoder；font 为 None 时返回 UNKNOWN_FONT"""
+        if font is None:
+            return UNKNOWN_FONT
+        key = font.objgen
+        if key != (0, 0) and key in self.decoders:
+            return self.decoders[key]
+        try:
+            decoder = self._build(font)
+        except Exception as e:
+            logger.warning("无法解析字体编码: %s", e)
+            decoder = UNKNOWN_FONT
+        self.fonts_parsed += 1
+        if key != (0, 0):
+            self.decoders[key] = decoder
+        return decoder
+
+    def _cmap(self, stream):
+        key = stream.objgen
+        if key != (0, 0) and key in self.cmaps:
+            return self.cmaps[key]
+        cmap = parse_cmap(self.read_bytes(stream))
+        if key != (0, 0):
+            self.cmaps[key] = cmap
+        return cmap
+
+    def _build(self, font):
+        composite = font.get("/Subtype") == "/Type0"
+        encoding = font.get("/Encoding")
+        encoding_name = str(encoding) if isinstance(encoding, pikepdf.Name) else ""
+        if composite:
+            # 预定义的 Unicode CMap（如 UniGB-UCS2-H、UniJIS-UTF16-H）本身就是 Unicode 编码
+            if "UCS2" in encoding_name or "UTF16" in encoding_name:
+                fallback = _codec_decoder("utf-16-be")
+            elif "UTF8" in encoding_name:
+                fallback = _codec_decoder("utf-8")
+            else:
+                fallback = None
+            single_byte = None
+            code_length = 2
+        else:
+            single_byte = single_byte_table(encoding)
+            fallback = decode_unknown if single_byte is None else None
+            code_length = 1
+
+        to_unicode = font.get("/ToUnicode")
+        if not isinstance(to_unicode, pikepdf.Stream):
+            if composite and fallback is None:
+                # Identity-H 等没有 ToUnicode 的复合字体无法还原文本，按原始字节处理
+                return UNKNOWN_FONT
+            return FontDecoder(code_length, single_byte=single_byte, fallback=fallback)
+
+        codespace, chars, ranges = self._cmap(to_unicode)
+        if codespace and len({len(low) for low, _ in codespace}) > 1:
+            code_length = None
+        elif codespace:
+            code_length = len(codespace[0][0])
+        elif chars:
+            code_length = len(next(iter(chars)))
+        return FontDecoder(code_length, codespace, chars, ranges, single_byte, fallback)
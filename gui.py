@@ -1,12 +1,24 @@
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
 import os
+import queue
+import threading
+import pikepdf
 from pdf_watermark_remove import (
-    extreme_watermark_removal, check_for_watermarks,
+    iter_removal, iter_page_texts, count_page_texts, get_keyword_matcher, find_watermark_layers,
+    document_layers, layer_names, is_watermark_layer_name,
     get_watermark_keywords, set_watermark_keywords,
     get_default_watermark_keywords, reset_watermark_keywords
 )
 
+# 后台任务消息队列的轮询间隔（毫秒）
+QUEUE_POLL_INTERVAL = 100
+
+def file_identity(path):
+    """文件的路径、修改时间和大小，文件被替换或修改后随之改变"""
+    file_stat = os.stat(path)
+    return (os.path.abspath(path), file_stat.st_mtime_ns, file_stat.st_size)
+
 class KeywordDialog(tk.Toplevel):
     def __init__(self, parent):
         super().__init__(parent)
@@ -115,9 +127,13 @@ class PDFWatermarkRemoverGUI:
         button_frame = ttk.Frame(main_frame)
         button_frame.grid(row=6, column=0, columnspan=2, pady=10)
         
-        ttk.Button(button_frame, text="Check Watermarks", command=self.check_watermarks).pack(side=tk.LEFT, padx=5)
-        ttk.Button(button_frame, text="Remove Watermarks", command=self.remove_watermarks).pack(side=tk.LEFT, padx=5)
+        self.check_button = ttk.Button(button_frame, text="Check Watermarks", command=self.check_watermarks)
+        self.check_button.pack(side=tk.LEFT, padx=5)
+        self.remove_button = ttk.Button(button_frame, text="Remove Watermarks", command=self.remove_watermarks)
+        self.remove_button.pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Manage Keywords", command=self.manage_keywords).pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(button_frame, text="Cancel", command=self.cancel_task, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
         
         # Log text area
         self.log_text = tk.Text(main_frame, height=10, width=60)
@@ -127,6 +143,15 @@ class PDFWatermarkRemoverGUI:
         scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL, command=self.log_text.yview)
         scrollbar.grid(row=7, column=2, sticky=(tk.N, tk.S))
         self.log_text.configure(yscrollcommand=scrollbar.set)
+        
+        # 后台任务状态：工作线程通过队列把进度和日志交给主线程更新界面
+        self.task_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.worker = None
+        
+        # 当前文件的逐页文本：(文件标识, [每页的文本记录], [图层名称])，修改
+        # 关键词后再次检查时只需重新匹配，不必重新解析PDF
+        self.page_text_cache = None
     
     def manage_keywords(self):
         """打开关键词管理对话框"""
@@ -155,7 +180,70 @@ class PDFWatermarkRemoverGUI:
     def log_message(self, message):
         self.log_text.insert(tk.END, message + "\n")
         self.log_text.see(tk.END)
-        self.root.update()
+
+    def start_task(self, target, *args):
+        """在后台线程中运行任务，并开始轮询任务队列"""
+        self.cancel_event.clear()
+        self.progress["value"] = 0
+        self.check_button.configure(state=tk.DISABLED)
+        self.remove_button.configure(state=tk.DISABLED)
+        self.cancel_button.configure(state=tk.NORMAL)
+        self.worker = threading.Thread(target=target, args=args, daemon=True)
+        self.worker.start()
+        self.root.after(QUEUE_POLL_INTERVAL, self.poll_queue)
+
+    def finish_task(self):
+        self.worker = None
+        self.check_button.configure(state=tk.NORMAL)
+        self.remove_button.configure(state=tk.NORMAL)
+        self.cancel_button.configure(state=tk.DISABLED)
+
+    def cancel_task(self):
+        """请求取消当前任务，工作线程在处理完当前页面后停止"""
+        if self.worker is not None:
+            self.cancel_event.set()
+            self.status_var.set("Cancelling...")
+            self.cancel_button.configure(state=tk.DISABLED)
+
+    def report_progress(self, done, total):
+        """工作线程中的进度回调"""
+        self.task_queue.put(("progress", done, total))
+
+    def poll_queue(self):
+        """在主线程中处理工作线程发来的消息"""
+        try:
+            while True:
+                message = self.task_queue.get_nowait()
+                kind = message[0]
+                if kind == "progress":
+                    _, done, total = message
+                    self.progress["maximum"] = total
+                    self.progress["value"] = done
+                elif kind == "log":
+                    self.log_message(message[1])
+                elif kind == "done":
+                    self.on_task_done(*message[1:])
+                    self.finish_task()
+                    return
+        except queue.Empty:
+            pass
+        self.root.after(QUEUE_POLL_INTERVAL, self.poll_queue)
+
+    def on_task_done(self, task, outcome, result):
+        if outcome == "cancelled":
+            self.log_message("\nCancelled")
+            self.status_var.set("Cancelled")
+        elif outcome == "error":
+            self.status_var.set(f"Error during watermark {task}")
+            messagebox.showerror("Error", result)
+        elif task == "check":
+            self.status_var.set("Watermark check completed")
+        elif result > 0:
+            self.status_var.set("Watermark removal completed")
+            messagebox.showinfo("Success", "Watermarks have been removed successfully!")
+        else:
+            self.status_var.set("No watermarks found")
+            messagebox.showinfo("Info", "No watermarks were found to remove")
 
     def check_watermarks(self):
         input_file = self.input_path.get()
@@ -166,23 +254,68 @@ class PDFWatermarkRemoverGUI:
         self.status_var.set("Checking for watermarks...")
         self.log_message("Starting watermark check...")
         self.log_message(f"Using keywords: {', '.join(get_watermark_keywords())}")
-        
+        self.start_task(self.run_check, input_file, list(get_watermark_keywords()))
+
+    def iter_and_cache_texts(self, input_file, identity):
+        """逐页提取文本，全部页面完成后保存为缓存；中途取消时不保存"""
+        pages = []
+        with pikepdf.open(input_file) as pdf:
+            layers = layer_names(document_layers(pdf))
+            for record in iter_page_texts(pdf, self.report_progress):
+                pages.append(record)
+                yield record
+        self.page_text_cache = (identity, pages, layers)
+
+    def iter_cached_texts(self, pages):
+        for i, record in enumerate(pages):
+            self.report_progress(i + 1, len(pages))
+            yield record
+
+    def run_check(self, input_file, keywords):
+        """工作线程：逐页检查水印，可在页面之间取消
+
+        同一文件再次检查时（例如修改关键词之后）只对缓存的页面文本重新匹配。
+        """
+        log = lambda message: self.task_queue.put(("log", message))
         try:
-            total_watermarks, pages_with_watermarks, watermarks_per_page = check_for_watermarks(input_file)
+            total_watermarks = 0
+            pages_with_watermarks = 0
+            matcher = get_keyword_matcher(keywords)
+            identity = file_identity(input_file)
+            cached = self.page_text_cache
+            if cached is not None and cached[0] == identity:
+                log("Using cached page text")
+                pages = self.iter_cached_texts(cached[1])
+            else:
+                pages = self.iter_and_cache_texts(input_file, identity)
             
-            if total_watermarks > 0:
-                self.log_message(f"\nFound {total_watermarks} watermarks in {len(pages_with_watermarks)} pages")
-                for page_num, (count, details) in watermarks_per_page.items():
-                    self.log_message(f"\nPage {page_num}: {count} watermarks")
+            for record in pages:
+                if self.cancel_event.is_set():
+                    pages.close()
+                    self.task_queue.put(("done", "check", "cancelled", None))
+                    return
+                details = count_page_texts(record, matcher)
+                count = sum(details.values())
+                if count > 0:
+                    total_watermarks += count
+                    pages_with_watermarks += 1
+                    log(f"\nPage {record['page']}: {count} watermarks")
                     for keyword, keyword_count in details.items():
-                        self.log_message(f"  - '{keyword}': {keyword_count}")
-            else:
-                self.log_message("\nNo watermarks found in the document")
+                        log(f"  - '{keyword}': {keyword_count}")
             
-            self.status_var.set("Watermark check completed")
+            # 全部页面完成后缓存一定存在；图层名称随文本一起缓存
+            layers = [name for name in self.page_text_cache[2] if is_watermark_layer_name(name, matcher)]
+            if layers:
+                total_watermarks += len(layers)
+                log(f"\nWatermark layers: {', '.join(layers)}")
+            
+            if total_watermarks > 0:
+                log(f"\nFound {total_watermarks} watermarks in {pages_with_watermarks} pages")
+            else:
+                log("\nNo watermarks found in the document")
+            self.task_queue.put(("done", "check", "ok", total_watermarks))
         except Exception as e:
-            self.status_var.set("Error during watermark check")
-            messagebox.showerror("Error", str(e))
+            self.task_queue.put(("done", "check", "error", str(e)))
 
     def remove_watermarks(self):
         input_file = self.input_path.get()
@@ -195,21 +328,37 @@ class PDFWatermarkRemoverGUI:
         self.status_var.set("Removing watermarks...")
         self.log_message("\nStarting watermark removal...")
         self.log_message(f"Using keywords: {', '.join(get_watermark_keywords())}")
-        
+        self.start_task(self.run_removal, input_file, output_file, list(get_watermark_keywords()))
+
+    def run_removal(self, input_file, output_file, keywords):
+        """工作线程：逐页移除水印并保存，取消时不写出输出文件"""
+        log = lambda message: self.task_queue.put(("log", message))
         try:
-            modified_pages = extreme_watermark_removal(input_file, output_file)
+            modified_pages = 0
+            stats = {}
+            with pikepdf.open(input_file) as pdf:
+                layers = find_watermark_layers(pdf, get_keyword_matcher(keywords))
+                if layers:
+                    log(f"Hiding watermark layers: {', '.join(layer_names(layers))}")
+                for record in iter_removal(pdf, self.report_progress, keywords, stats=stats, layers=layers):
+                    if self.cancel_event.is_set():
+                        self.task_queue.put(("done", "removal", "cancelled", None))
+                        return
+                    if record["modified"]:
+                        modified_pages += 1
+                pdf.save(output_file)
             
-            if modified_pages > 0:
-                self.log_message(f"\nSuccessfully processed {modified_pages} pages")
-                self.log_message(f"Saved output to: {output_file}")
-                self.status_var.set("Watermark removal completed")
-                messagebox.showinfo("Success", "Watermarks have been removed successfully!")
-            else:
-                self.status_var.set("No watermarks found")
-                messagebox.showinfo("Info", "No watermarks were found to remove")
+            # 只有水印图层时页面不变，关闭的图层同样算作移除了水印
+            hidden_layers = stats["watermark_layers"]
+            if modified_pages > 0 or hidden_layers:
+                if hidden_layers:
+                    log(f"\nHid {hidden_layers} watermark layers")
+                if modified_pages > 0:
+                    log(f"\nSuccessfully processed {modified_pages} pages")
+                log(f"Saved output to: {output_file}")
+            self.task_queue.put(("done", "removal", "ok", modified_pages + hidden_layers))
         except Exception as e:
-            self.status_var.set("Error during watermark removal")
-            messagebox.showerror("Error", str(e))
+            self.task_queue.put(("done", "removal", "error", str(e)))
 
 def main():
     root = tk.Tk()
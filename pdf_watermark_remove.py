@@ -3,11 +3,27 @@
 给定一个pdf路径，以及一个列表，可修改pdf内容，删除所有符合条件的文字。
 """
 
+__version__ = "1.1.0"
+
 import re
 import os
+import math
+import time
+import random
+import zlib
+import hashlib
+import logging
+import functools
+import collections
+import threading
 import pikepdf
 from pikepdf import Pdf, PdfImage, Name, Dictionary, Object
 
+from run_report import RunReport, NULL_REPORT
+from font_decoding import FontCache, UNKNOWN_FONT
+
+logger = logging.getLogger("pdf_watermark_remove")
+
 # 默认水印关键词列表
 DEFAULT_WATERMARK_KEYWORDS = [
     "Review Copy",
@@ -20,8 +36,42 @@ DEFAULT_WATERMARK_KEYWORDS = [
 # 当前使用的水印关键词列表
 WATERMARK_KEYWORDS = DEFAULT_WATERMARK_KEYWORDS.copy()
 
-# 调试模式
-DEBUG = True
+# 解码后流数据缓存的容量上限（MB），为 0 时不缓存
+DECODED_STREAM_CACHE_MB = 64
+
+# 重复内容检测：出现在超过该比例页面上的文本块或表单视为疑似水印
+REPEATED_CONTENT_FRACTION = 0.6
+
+# 重复内容检测：至少出现在这么多个页面上才会被标记，避免短文档误判
+REPEATED_CONTENT_MIN_PAGES = 3
+
+# 按指纹移除、没有命中关键词的内容在统计中使用的名称
+REPEATED_CONTENT_LABEL = "[重复内容]"
+
+# 按结构标记识别的水印在统计中使用的名称：标记为水印的标记内容序列
+# （/Artifact <</Subtype /Watermark>> BDC ... EMC）和 /Watermark 类型的注释
+WATERMARK_ARTIFACT_LABEL = "[水印标记]"
+WATERMARK_ANNOTATION_LABEL = "[水印注释]"
+WATERMARK_LAYER_LABEL = "[水印图层]"
+
+# 被移除的水印表单（Form XObject）在统计中使用的名称
+WATERMARK_FORM_LABEL = "[水印表单]"
+
+# 名称与之匹配的可选内容组（图层）视为水印图层
+WATERMARK_LAYER_PATTERN = re.compile(r"watermark|水印", re.IGNORECASE)
+
+# 水印图层的处理方式：hide 在图层配置中关闭（与页数无关），strip 同时删除
+# 页面中属于水印图层的 BDC /OC ... EMC 序列，None 不处理图层
+LAYER_MODES = ("hide", "strip", None)
+
+# 快速检查默认抽样的页数
+QUICK_CHECK_SAMPLE = 20
+
+# 快速检查的抽样方式：前 N 页、全文等间隔、随机
+SAMPLING_STRATEGIES = ("first", "stride", "random")
+
+# 快速检查未发现水印时，按"水印至少出现在这一比例的页面上"计算判断的可信度
+QUICK_CHECK_MIN_FRACTION = 0.5
 
 def set_watermark_keywords(keywords):
     """设置新的水印关键词列表"""
@@ -41,61 +91,1497 @@ def reset_watermark_keywords():
     global WATERMARK_KEYWORDS
     WATERMARK_KEYWORDS = DEFAULT_WATERMARK_KEYWORDS.copy()
 
-def debug_print(message):
-    """调试信息打印"""
-    if DEBUG:
-        print(f"[DEBUG] {message}")
+def _build_trie(words):
+    """把关键词构建成按字符展开的前缀树"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+    return trie
+
+def _trie_to_pattern(trie):
+    """把前缀树转换为正则表达式，公共前缀只出现一次
+
+    按后序遍历逐个节点生成，不使用递归，很长的关键词也不会超出递归深度。
+    """
+    patterns = {}
+    stack = [(trie, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if not expanded:
+            stack.append((node, True))
+            stack.extend((child, False) for char, child in node.items() if char)
+            continue
+        branches = [re.escape(char) + patterns.pop(id(child))
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            pattern = ''
+        elif len(branches) == 1 and '' not in node:
+            pattern = branches[0]
+        else:
+            pattern = '(?:' + '|'.join(branches) + ')'
+            # 贪婪的可选分组保证同一位置优先匹配更长的关键词
+            if '' in node:
+                pattern += '?'
+        patterns[id(node)] = pattern
+    return patterns[id(trie)]
+
+class KeywordMatcher:
+    """由关键词列表编译而成的大小写无关多模式匹配器
+
+    关键词合并为一棵前缀树，编译成单个正则表达式，按字面匹配，支持 str 和 bytes。
+    """
+
+    def __init__(self, keywords):
+        self.keywords = tuple(keywords)
+        # 小写形式 -> 原始关键词，用于把匹配结果归并到关键词上
+        self._canonical = {}
+        for keyword in self.keywords:
+            if keyword:
+                self._canonical.setdefault(keyword.lower(), keyword)
+        self._canonical_bytes = {key.encode('utf-8'): keyword
+                                 for key, keyword in self._canonical.items()}
+        
+        if self._canonical:
+            source = _trie_to_pattern(_build_trie(self._canonical))
+        else:
+            # 空关键词列表：永远不匹配
+            source = '(?!)'
+        self._pattern = re.compile(source, re.IGNORECASE)
+        self._bytes_pattern = re.compile(source.encode('utf-8'), re.IGNORECASE)
+    
+    def _pattern_for(self, text):
+        return self._pattern if isinstance(text, str) else self._bytes_pattern
+    
+    def _keyword_for(self, matched):
+        if isinstance(matched, str):
+            return self._canonical.get(matched.lower(), matched)
+        return self._canonical_bytes.get(matched.lower(), matched.decode('utf-8', errors='ignore'))
+    
+    def search(self, text):
+        """文本中是否包含任一关键词"""
+        return self._pattern_for(text).search(text) is not None
+    
+    def finditer(self, text):
+        """依次返回 (起始位置, 结束位置, 关键词)"""
+        for match in self._pattern_for(text).finditer(text):
+            yield match.start(), match.end(), self._keyword_for(match.group())
+    
+    def count(self, text):
+        """统计文本中的关键词，返回 (总数, {关键词: 次数})"""
+        watermark_count = 0
+        watermark_details = {}
+        for match in self._pattern_for(text).finditer(text):
+            keyword = self._keyword_for(match.group())
+            watermark_details[keyword] = watermark_details.get(keyword, 0) + 1
+            watermark_count += 1
+        return watermark_count, watermark_details
+
+@functools.lru_cache(maxsize=8)
+def _compile_keyword_matcher(keywords):
+    return KeywordMatcher(keywords)
+
+def get_keyword_matcher(keywords=None):
+    """获取关键词列表对应的匹配器，同一组关键词只编译一次"""
+    if keywords is None:
+        keywords = WATERMARK_KEYWORDS
+    return _compile_keyword_matcher(tuple(keywords))
 
 def count_watermarks_in_text(text):
     """统计文本中的水印数量"""
-    watermark_count = 0
-    watermark_details = {}
+    return get_keyword_matcher().count(text)
+
+class DecodedStreamCache:
+    """解码后流数据的 LRU 缓存，键为 (文档标识, objgen)，同一文件再次打开也能命中"""
+
+    def __init__(self, max_mb=DECODED_STREAM_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+    
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+_decoded_stream_cache = DecodedStreamCache()
+
+def get_decoded_stream_cache():
+    """获取进程内共用的解码流缓存"""
+    return _decoded_stream_cache
+
+def set_decoded_stream_cache_size(max_mb):
+    """设置解码流缓存的容量上限（MB），为 0 时关闭缓存"""
+    global _decoded_stream_cache
+    _decoded_stream_cache = DecodedStreamCache(max_mb)
+
+def document_cache_key(pdf):
+    """返回文档来源文件的标识，用于跨多次打开共用缓存；无法确定时返回 None"""
+    try:
+        filename = os.path.abspath(pdf.filename)
+        file_stat = os.stat(filename)
+    except (OSError, TypeError, ValueError):
+        return None
+    return (filename, file_stat.st_mtime_ns, file_stat.st_size)
+
+_scratch = threading.local()
+
+def _scratch_stream():
+    """每个线程一个可反复写入的临时流，用于解析缓存中的数据"""
+    if not hasattr(_scratch, "stream"):
+        _scratch.pdf = pikepdf.new()
+        _scratch.stream = pikepdf.Stream(_scratch.pdf, b"")
+    return _scratch.stream
+
+class StreamReader:
+    """读取一个文档中流的解码数据，原始文件中的流经由 DecodedStreamCache 缓存"""
+
+    def __init__(self, pdf, cache=None, run_report=None):
+        self.cache = cache if cache is not None else get_decoded_stream_cache()
+        self.report = run_report if run_report is not None else NULL_REPORT
+        self.document_key = document_cache_key(pdf) if self.cache.max_bytes > 0 else None
+        # 原始文件中的对象编号都小于 trailer 的 /Size
+        self.object_limit = int(pdf.trailer.get("/Size", 0))
+        self.fonts = FontCache(self.read_bytes)
+    
+    def _cache_key(self, stream):
+        if self.document_key is None:
+            return None
+        objgen = stream.objgen
+        if not 0 < objgen[0] < self.object_limit:
+            return None
+        return (self.document_key, objgen)
+    
+    def read_bytes(self, stream):
+        """返回流解码后的数据"""
+        key = self._cache_key(stream)
+        data = self.cache.get(key) if key is not None else None
+        if data is None:
+            with self.report.stage("decode"):
+                data = stream.read_bytes()
+            self.report.count("bytes_decoded", len(data))
+            if key is not None:
+                self.cache.put(key, data)
+        else:
+            self.report.count("decode_cache_hits")
+        return data
+    
+    def parse(self, stream):
+        """把流解析为内容流指令"""
+        key = self._cache_key(stream)
+        if key is None and not self.report.enabled:
+            return pikepdf.parse_content_stream(stream)
+        # 先取得解码数据（经由缓存或计入报告），再在临时流上解析
+        return self.parse_data(self.read_bytes(stream))
+    
+    def parse_data(self, data):
+        """把已解码的流数据解析为内容流指令"""
+        with self.report.stage("parse"):
+            return _parse_data(data)
+
+def _parse_data(data):
+    scratch = _scratch_stream()
+    scratch.write(data)
+    return pikepdf.parse_content_stream(scratch)
+
+# 显示文本的操作符
+TEXT_SHOW_OPERATORS = {"Tj", "TJ", "'", '"'}
+
+# TJ 数组中小于该值（千分之一字号）的位移视为单词间距
+TJ_SPACE_THRESHOLD = -200
+
+# 改变当前字体的操作符：Tf 选择字体，q/Q 保存和恢复图形状态（其中包括字体）
+TEXT_STATE_OPERATORS = {"Tf", "q", "Q"}
+
+_TEXT_OPERATORS = TEXT_SHOW_OPERATORS | TEXT_STATE_OPERATORS
+
+class TextState:
+    """跟踪内容流中的当前字体，按字体把显示文本的字符串解码为 Unicode"""
+
+    def __init__(self, resources=None, fonts=None):
+        self.fonts = fonts if fonts is not None else FontCache()
+        self.font_resources = resources.get("/Font") if resources is not None else None
+        self.decoder = UNKNOWN_FONT
+        self._saved = []
+        # 字体资源名 -> 解码器，同一个流中反复选择同一字体时不必再查资源字典
+        self._by_name = {}
+    
+    def update(self, operator, operands):
+        """处理一条 TEXT_STATE_OPERATORS 中的指令"""
+        if operator == "Tf":
+            name = str(operands[0]) if operands else None
+            decoder = self._by_name.get(name)
+            if decoder is None:
+                font = None
+                if name is not None and self.font_resources is not None:
+                    font = self.font_resources.get(name)
+                decoder = self._by_name[name] = self.fonts.decoder_for(font)
+            self.decoder = decoder
+        elif operator == "q":
+            self._saved.append(self.decoder)
+        elif operator == "Q" and self._saved:
+            self.decoder = self._saved.pop()
+    
+    def track(self, instructions):
+        """只跟踪一组指令中的字体变化，不解码文本"""
+        for operands, operator in instructions:
+            operator = str(operator)
+            if operator in TEXT_STATE_OPERATORS:
+                self.update(operator, operands)
+    
+    def show_text(self, operator, operands):
+        """解码一条文本显示指令显示的文本"""
+        decode = self.decoder.decode
+        if operator == "TJ":
+            parts = []
+            for item in operands[0]:
+                if isinstance(item, pikepdf.String):
+                    parts.append(decode(bytes(item)))
+                elif item <= TJ_SPACE_THRESHOLD:
+                    parts.append(" ")
+            return "".join(parts)
+        # Tj 和 ' 的字符串是第一个操作数，" 的字符串是第三个
+        return decode(bytes(operands[-1]))
+
+def extract_block_text(instructions, text_state=None):
+    """提取一组内容流指令中显示的文本
+
+    给出 TextState 时按当前字体解码，并把其中的字体变化记录到 text_state；
+    否则没有字体信息，按原始字节解码。
+    """
+    if text_state is None:
+        text_state = TextState()
+    parts = []
+    for operands, operator in instructions:
+        operator = str(operator)
+        if operator not in _TEXT_OPERATORS:
+            continue
+        if operator in TEXT_SHOW_OPERATORS:
+            if operands:
+                parts.append(text_state.show_text(operator, operands))
+        else:
+            text_state.update(operator, operands)
+    return "".join(parts)
+
+class TextBlock:
+    """内容流中的一个文本块（BT...ET），text 在首次读取时按当前字体解码"""
+
+    def __init__(self, instructions, text_state, closed=True):
+        self.instructions = instructions
+        self.closed = closed
+        self._text_state = text_state
+        self._text = None
+    
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = extract_block_text(self.instructions, self._text_state)
+        return self._text
+    
+    def finish(self):
+        """没有读取文本时只跟踪其中的字体变化，后面的文本块才能正确解码"""
+        if self._text is None:
+            self._text_state.track(self.instructions)
+
+def iter_text_blocks(instructions, text_state):
+    """按顺序遍历内容流指令，文本块产出为 TextBlock，其余指令原样产出
+
+    未闭合的文本块最后产出，其 closed 为 False。
+    """
+    block = None
+    for instruction in instructions:
+        operator = str(instruction.operator)
+        if block is not None:
+            block.append(instruction)
+            if operator == "ET":
+                text_block = TextBlock(block, text_state)
+                yield text_block
+                text_block.finish()
+                block = None
+        elif operator == "BT":
+            block = [instruction]
+        else:
+            if operator in TEXT_STATE_OPERATORS:
+                text_state.update(operator, instruction.operands)
+            yield instruction
+    if block is not None:
+        text_block = TextBlock(block, text_state, closed=False)
+        yield text_block
+        text_block.finish()
+
+# 单个内容流的过滤结果：新字节（未修改时为 None）、删除的文本块数、
+# 被删除文本块中的关键词统计、保留内容中仍然残留的关键词统计，以及按关键词
+# 删除的文本块模板 [("block", 指纹, {关键词: 次数}, 文本), ...]
+StreamFilterResult = collections.namedtuple(
+    "StreamFilterResult", ["new_bytes", "removed_blocks", "found", "residual", "templates"],
+    defaults=[()])
+
+def _is_watermark_properties(properties):
+    return isinstance(properties, pikepdf.Dictionary) and properties.get("/Subtype") == "/Watermark"
+
+def watermark_property_names(resources):
+    """资源字典 /Properties 中标记为水印的属性名集合"""
+    properties = resources.get("/Properties") if resources is not None else None
+    if properties is None:
+        return frozenset()
+    return frozenset(str(name) for name, value in properties.items() if _is_watermark_properties(value))
+
+def watermark_layer_names(resources, layers):
+    """资源字典 /Properties 中指向水印图层的属性名集合
+
+    layers 为水印图层的 objgen 集合；可选内容成员字典（OCMD）只有在其成员
+    全部是水印图层时才计入。
+    """
+    properties = resources.get("/Properties") if resources is not None and layers else None
+    if properties is None:
+        return frozenset()
+    names = set()
+    for name, value in properties.items():
+        if value.get("/Type") == "/OCMD":
+            members = value.get("/OCGs")
+            members = list(members) if isinstance(members, pikepdf.Array) else [members]
+            if members and all(member is not None and member.objgen in layers for member in members):
+                names.add(str(name))
+        elif value.objgen in layers:
+            names.add(str(name))
+    return frozenset(names)
+
+def strip_watermark_artifacts(instructions, property_names=frozenset(), layer_names=frozenset()):
+    """删除标记为水印的标记内容序列（/Artifact <</Subtype /Watermark>> BDC ... EMC）
+
+    property_names 为标记为水印的属性名，layer_names 中的属性名对应水印图层。
+    返回 (保留的指令, {标签: 序列数})；序列没有闭合时原样返回。
+    """
+    kept = []
+    removed = {}
+    depth = 0
+    for instruction in instructions:
+        operator = str(instruction.operator)
+        if depth:
+            if operator in ("BMC", "BDC"):
+                depth += 1
+            elif operator == "EMC":
+                depth -= 1
+            continue
+        if operator == "BDC" and len(instruction.operands) == 2:
+            tag, properties = instruction.operands
+            label = None
+            if tag == Name.Artifact and (_is_watermark_properties(properties) or str(properties) in property_names):
+                label = WATERMARK_ARTIFACT_LABEL
+            elif tag == Name.OC and str(properties) in layer_names:
+                label = WATERMARK_LAYER_LABEL
+            if label is not None:
+                depth = 1
+                removed[label] = removed.get(label, 0) + 1
+                continue
+        kept.append(instruction)
+    if depth:
+        return instructions, {}
+    return kept, removed
+
+def strip_structural_watermarks(data, instructions, resources=None, layers=None, report=NULL_REPORT):
+    """按结构标记删除水印序列和水印图层序列，返回 (保留的指令, {标签: 序列数})
+
+    先按字节判断流中有没有可能的水印标记，没有时不多遍历一次指令。
+    """
+    property_names = watermark_property_names(resources)
+    layer_names = watermark_layer_names(resources, layers)
+    if b"BDC" not in data or not (b"/Watermark" in data or property_names or layer_names):
+        return instructions, {}
+    with report.stage("structure"):
+        kept, structural = strip_watermark_artifacts(instructions, property_names, layer_names)
+    if structural:
+        report.count("watermark_artifacts", structural.get(WATERMARK_ARTIFACT_LABEL, 0))
+        report.count("watermark_layer_sequences", structural.get(WATERMARK_LAYER_LABEL, 0))
+    return kept, structural
+
+def merge_watermark_details(target, details):
+    """把 {关键词: 次数} 累加到 target 中"""
+    for keyword, count in details.items():
+        target[keyword] = target.get(keyword, 0) + count
+    return target
+
+def _read_instructions(stream, reader=None):
+    """读取并解析流，返回 (解码后的数据, 指令列表, 运行报告)"""
+    if reader is not None:
+        data = reader.read_bytes(stream)
+        return data, reader.parse_data(data), reader.report
+    data = stream.read_bytes()
+    return data, _parse_data(data), NULL_REPORT
+
+def filter_content_stream(stream, matcher, rewrite=True, reader=None, fingerprints=None,
+                          collect_templates=False, resources=None, layers=None, text_state=None):
+    """删除内容流中包含水印关键词的文本块（BT...ET），返回 StreamFilterResult
+
+    指令按字节切分后原样输出，内嵌图像等二进制数据不变；没有删除任何内容或
+    rewrite 为 False 时 new_bytes 为 None。fingerprints 命中的文本块直接删除。text_state 为
+    同一页面前面的流留下的字体状态，页面的多个内容流按一个流处理。
+    """
+    data, instructions, report = _read_instructions(stream, reader)
+    report.count("streams_scanned")
+    
+    # 结构标记的序列整个删除，不解码其中的文本；其余内容照常按关键词过滤
+    instructions, structural = strip_structural_watermarks(data, instructions, resources, layers, report)
+    
+    if text_state is None:
+        text_state = TextState(resources, reader.fonts if reader is not None else None)
+    
+    kept = []
+    removed_blocks = sum(structural.values())
+    found = dict(structural)
+    residual = {}
+    templates = []
+    with report.stage("match"):
+        for item in iter_text_blocks(instructions, text_state):
+            if not isinstance(item, TextBlock):
+                kept.append(item)
+                continue
+            if not item.closed:
+                # 没有闭合的文本块原样保留，其中的关键词计为残留
+                kept.extend(item.instructions)
+                merge_watermark_details(residual, matcher.count(item.text)[1])
+                continue
+            fingerprint = None
+            details = None
+            if fingerprints:
+                fingerprint = block_fingerprint(item.instructions)
+                details = fingerprints.get(fingerprint)
+            if details is not None:
+                removed_blocks += 1
+                merge_watermark_details(found, details)
+                report.count("fingerprint_hits")
+            elif matcher.search(item.text):
+                removed_blocks += 1
+                details = matcher.count(item.text)[1]
+                merge_watermark_details(found, details)
+                if collect_templates:
+                    templates.append(("block", fingerprint or block_fingerprint(item.instructions),
+                                      details, item.text))
+            else:
+                kept.extend(item.instructions)
+    
+    new_bytes = None
+    if removed_blocks and rewrite:
+        with report.stage("rewrite"):
+            new_bytes = pikepdf.unparse_content_stream(kept)
+    return StreamFilterResult(new_bytes, removed_blocks, found, residual, tuple(templates))
+
+def extract_stream_text(stream, reader=None, resources=None):
+    """提取内容流中显示的全部文本，resources 中的字体用于解码"""
+    if reader is not None:
+        return extract_block_text(reader.parse(stream), TextState(resources, reader.fonts))
+    return extract_block_text(pikepdf.parse_content_stream(stream), TextState(resources))
+
+def _fingerprint(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def block_fingerprint(block):
+    """文本块（BT...ET 指令列表）的指纹
+
+    指令先按 pikepdf 的规范格式重新序列化，空白和换行的差异不影响结果。
+    """
+    return _fingerprint(pikepdf.unparse_content_stream(block))
+
+def form_fingerprint(xobject, reader=None):
+    """Form XObject 的指纹，由解码后的内容计算，内容相同的不同副本指纹相同"""
+    data = reader.read_bytes(xobject) if reader is not None else xobject.read_bytes()
+    return _fingerprint(data)
+
+class FingerprintIndex:
+    """记录每个文本块和表单指纹出现在哪些页面上，candidates() 返回在各页重复出现的疑似水印"""
+
+    def __init__(self):
+        self.page_count = 0
+        self.pages = collections.defaultdict(set)
+        self.kinds = {}
+        self.samples = {}
+    
+    def add(self, fingerprint, page_num, kind, sample=""):
+        self.pages[fingerprint].add(page_num)
+        if fingerprint not in self.kinds:
+            self.kinds[fingerprint] = kind
+            self.samples[fingerprint] = sample
+    
+    def candidates(self, fraction=REPEATED_CONTENT_FRACTION, min_pages=REPEATED_CONTENT_MIN_PAGES):
+        """出现页数超过总页数 fraction 且不少于 min_pages 的指纹
+
+        返回 {指纹: {REPEATED_CONTENT_LABEL: 1}}，可直接作为 fingerprints 参数
+        """
+        threshold = max(min_pages, self.page_count * fraction)
+        return {fingerprint: {REPEATED_CONTENT_LABEL: 1}
+                for fingerprint, pages in self.pages.items() if len(pages) >= threshold}
+    
+    def describe(self, fingerprints):
+        """把指纹集合整理为便于查看的记录列表，按出现页数从多到少排列"""
+        records = [{
+            "fingerprint": fingerprint.hex(),
+            "kind": self.kinds[fingerprint],
+            "pages": len(self.pages[fingerprint]),
+            "sample": self.samples[fingerprint][:80],
+        } for fingerprint in fingerprints]
+        records.sort(key=lambda record: record["pages"], reverse=True)
+        return records
+
+def build_fingerprint_index(pdf, reader=None):
+    """扫描所有页面，建立文本块和被调用表单的指纹索引
+
+    每个内容流只解析一次，指纹计算与内容长度成线性关系，不做关键词匹配。
+    表单按页面内容中的 Do 指令统计，只出现在资源字典里而未被调用的表单不计。
+    """
+    if reader is None:
+        reader = StreamReader(pdf)
+    index = FingerprintIndex()
+    form_fingerprints = {}
+    for i, page in enumerate(pdf.pages):
+        page_num = i + 1
+        index.page_count += 1
+        if "/Contents" not in page:
+            continue
+        resources = page.get("/Resources", {})
+        xobjects = resources.get("/XObject", {})
+        # 页面的多个内容流共用字体状态，前一个流中选择的字体在后一个流中仍然有效
+        text_state = TextState(resources, reader.fonts)
+        for obj in _page_content_streams(page):
+            try:
+                instructions = reader.parse(obj)
+            except Exception as e:
+                logger.warning("建立指纹索引时无法解析内容流: %s", e)
+                continue
+            for item in iter_text_blocks(instructions, text_state):
+                if isinstance(item, TextBlock):
+                    if item.closed and item.text.strip():
+                        index.add(block_fingerprint(item.instructions), page_num, "block", item.text)
+                    continue
+                operands, operator = item
+                if str(operator) == "Do" and operands and operands[0] in xobjects:
+                    xobject = xobjects[operands[0]]
+                    if xobject.get("/Subtype") != "/Form":
+                        continue
+                    key = xobject.objgen
+                    if key not in form_fingerprints or key == (0, 0):
+                        form_fingerprints[key] = form_fingerprint(xobject, reader)
+                    index.add(form_fingerprints[key], page_num, "form", str(operands[0]))
+    return index
+
+def is_watermark_form_marked(xobject):
+    """表单是否带有 Acrobat"添加水印"写入的 /PieceInfo 标记"""
+    piece_info = xobject.get("/PieceInfo")
+    if not isinstance(piece_info, pikepdf.Dictionary):
+        return False
+    compound = piece_info.get("/ADBE_CompoundType")
+    return isinstance(compound, pikepdf.Dictionary) and compound.get("/Private") == "/Watermark"
+
+class XObjectScanner:
+    """在一个文档范围内判定 Form XObject 是否为水印，结果按 objgen 缓存
+
+    不是水印的表单继续检查其中嵌套的表单；remove 为 False 时只判定和计数，不修改资源。
+    """
+
+    def __init__(self, matcher, reader=None, fingerprints=None, collect_templates=False, layers=None,
+                 remove=True):
+        self.matcher = matcher
+        self.remove = remove
+        self.reader = reader
+        self.fingerprints = fingerprints
+        self.layers = layers
+        self.collect_templates = collect_templates
+        self.templates = []
+        # 直接或间接嵌套了水印表单的表单 -> 其中（已被移除）的水印表单数
+        self.nested = {}
+        # 已处理的间接 /XObject 字典 -> 从中移除的水印表单数（含嵌套），多个资源字典共用时只处理一次
+        self.filtered = {}
+        self.report = reader.report if reader is not None else NULL_REPORT
+        self.verdicts = {}
+        self.visited = set()
+        self.forms_scanned = 0
+    
+    def is_watermark(self, xobject):
+        """判断 XObject 是否为包含水印关键词的表单"""
+        key = xobject.objgen
+        if key in self.verdicts:
+            return self.verdicts[key]
+        if key in self.visited:
+            # 表单间接引用了自身，按非水印处理
+            return False
+        self.visited.add(key)
+        
+        verdict = False
+        if xobject.get("/Subtype") == "/Form":
+            try:
+                self.forms_scanned += 1
+                verdict = is_watermark_form_marked(xobject)
+                if not verdict and self.layers:
+                    layer = xobject.get("/OC")
+                    verdict = layer is not None and layer.objgen in self.layers
+                if not verdict and self.fingerprints:
+                    verdict = form_fingerprint(xobject, self.reader) in self.fingerprints
+                    if verdict:
+                        self.report.count("fingerprint_hits")
+                if not verdict:
+                    text = extract_stream_text(xobject, self.reader, xobject.get("/Resources"))
+                    verdict = self.matcher.search(text)
+                    if verdict and self.collect_templates:
+                        self.templates.append(("form", form_fingerprint(xobject, self.reader),
+                                               self.matcher.count(text)[1], text))
+                if not verdict:
+                    self._filter_nested(xobject)
+            except Exception as e:
+                logger.warning("处理XObject时出错: %s", e)
+        
+        self.verdicts[key] = verdict
+        return verdict
+    
+    def _filter_nested(self, form):
+        """移除表单资源中嵌套的水印表单"""
+        resources = form.get("/Resources")
+        if resources is None or "/XObject" not in resources:
+            return
+        xobjects = resources["/XObject"]
+        key = xobjects.objgen
+        if key != (0, 0) and key in self.filtered:
+            count = self.filtered[key]
+        else:
+            count = 0
+            for name in list(xobjects.keys()):
+                xobject = xobjects[name]
+                if self.is_watermark(xobject):
+                    count += 1
+                    if self.remove:
+                        logger.debug("移除嵌套的水印XObject: %s", name)
+                        del xobjects[name]
+                        self.report.count("xobjects_dropped")
+                else:
+                    count += self.nested.get(xobject.objgen, 0)
+            if key != (0, 0):
+                self.filtered[key] = count
+        if count:
+            self.nested[form.objgen] = count
+
+    def count_forms(self, resources):
+        """资源字典中的水印表单数，包括未被判为水印的表单中嵌套的水印表单"""
+        xobjects = resources.get("/XObject") if resources is not None else None
+        if not isinstance(xobjects, pikepdf.Dictionary):
+            return 0
+        count = 0
+        for xobject in list(xobjects.values()):
+            if self.is_watermark(xobject):
+                count += 1
+            else:
+                count += self.nested.get(xobject.objgen, 0)
+        return count
+
+def is_watermark_annotation(annotation, xobject_scanner=None):
+    """判断注释是否为水印：/Watermark 类型，或给出 XObjectScanner 时外观或内容命中关键词"""
+    if annotation.get("/Subtype") == "/Watermark":
+        return True
+    if xobject_scanner is None:
+        return False
+    appearance = annotation.get("/AP")
+    normal = appearance.get("/N") if isinstance(appearance, pikepdf.Dictionary) else None
+    if isinstance(normal, pikepdf.Stream) and xobject_scanner.is_watermark(normal):
+        return True
+    contents = annotation.get("/Contents")
+    return isinstance(contents, pikepdf.String) and xobject_scanner.matcher.search(str(contents))
+
+def count_watermark_annotations(page, xobject_scanner=None):
+    """统计页面中的水印注释数；不给出 XObjectScanner 时只看结构，不做关键词匹配"""
+    annotations = page.get("/Annots")
+    if not isinstance(annotations, pikepdf.Array):
+        return 0
+    return sum(1 for annotation in annotations if is_watermark_annotation(annotation, xobject_scanner))
+
+def filter_annotations(page, xobject_scanner=None):
+    """移除页面中的水印注释，保留链接、表单域等其他注释，返回移除的注释数"""
+    annotations = page.get("/Annots")
+    if not isinstance(annotations, pikepdf.Array):
+        return 0
+    kept = [annotation for annotation in annotations
+            if not is_watermark_annotation(annotation, xobject_scanner)]
+    removed = len(annotations) - len(kept)
+    if removed:
+        if kept:
+            page["/Annots"] = pikepdf.Array(kept)
+        else:
+            del page["/Annots"]
+    return removed
+
+def document_layers(pdf):
+    """文档目录的 /OCProperties 中的全部图层（可选内容组）"""
+    properties = pdf.Root.get("/OCProperties")
+    if not isinstance(properties, pikepdf.Dictionary):
+        return []
+    groups = properties.get("/OCGs")
+    if not isinstance(groups, pikepdf.Array):
+        return []
+    return [group for group in groups if isinstance(group, pikepdf.Dictionary)]
+
+def layer_names(layers):
+    """图层列表的名称列表"""
+    return [str(layer.get("/Name", "")) for layer in layers]
+
+def is_watermark_layer_name(name, matcher=None):
+    """名称与 WATERMARK_LAYER_PATTERN 匹配、或给出 matcher 时包含水印关键词的图层是水印图层"""
+    return bool(WATERMARK_LAYER_PATTERN.search(name) or (matcher is not None and matcher.search(name)))
+
+def find_watermark_layers(pdf, matcher=None):
+    """在文档目录中查找水印图层，只读取目录中的图层列表，耗时与页数无关"""
+    return [layer for layer in document_layers(pdf)
+            if is_watermark_layer_name(str(layer.get("/Name", "")), matcher)]
+
+def layer_objgens(layers):
+    """图层列表的 objgen 集合，可以传给子进程"""
+    return frozenset(layer.objgen for layer in layers)
+
+def hide_watermark_layers(pdf, layers):
+    """在默认配置 /D 和其他配置 /Configs 中关闭水印图层，返回关闭的图层数
+
+    图层加入 /OFF、移出 /ON，并从 /AS（按打印、查看等事件自动设置图层
+    状态）中移除，打印时也不会重新显示。页面内容不做任何修改。
+    """
+    properties = pdf.Root.get("/OCProperties")
+    if not layers or not isinstance(properties, pikepdf.Dictionary):
+        return 0
+    keys = layer_objgens(layers)
+    configs = [properties.get("/D")]
+    if isinstance(properties.get("/Configs"), pikepdf.Array):
+        configs.extend(properties["/Configs"])
+    for config in configs:
+        if not isinstance(config, pikepdf.Dictionary):
+            continue
+        if isinstance(config.get("/ON"), pikepdf.Array):
+            config["/ON"] = pikepdf.Array([group for group in config["/ON"] if group.objgen not in keys])
+        off = list(config["/OFF"]) if isinstance(config.get("/OFF"), pikepdf.Array) else []
+        hidden = {group.objgen for group in off}
+        config["/OFF"] = pikepdf.Array(off + [layer for layer in layers if layer.objgen not in hidden])
+        if isinstance(config.get("/AS"), pikepdf.Array):
+            for usage in config["/AS"]:
+                if isinstance(usage.get("/OCGs"), pikepdf.Array):
+                    usage["/OCGs"] = pikepdf.Array([group for group in usage["/OCGs"]
+                                                    if group.objgen not in keys])
+    return len(layers)
+
+def index_page_resources(pdf):
+    """建立文档中不重复的页面资源字典索引
+
+    间接引用的资源字典按 objgen 去重，直接写在页面里的资源字典只属于该页面。
+    返回 {键: (资源字典, [页码, ...])}
+    """
+    index = {}
+    for i, page in enumerate(pdf.pages):
+        if "/Resources" not in page:
+            continue
+        resources = page["/Resources"]
+        key = resources.objgen
+        if key == (0, 0):
+            key = ("page", i)
+        if key not in index:
+            index[key] = (resources, [])
+        index[key][1].append(i + 1)
+    return index
+
+def filter_resources(resources, xobject_scanner):
+    """就地清理一个资源字典：移除水印XObject和图形状态参数字典
+
+    返回 (资源字典是否被修改, 移除的水印表单数)，后者包括保留的表单中
+    嵌套移除的水印表单
+    """
+    modified = False
+    forms = 0
+    
+    if "/XObject" in resources:
+        xobjects = resources["/XObject"]
+        key = xobjects.objgen
+        if key != (0, 0) and key in xobject_scanner.filtered:
+            # 与其他页面共用的 /XObject 字典已处理过，沿用当时的计数
+            forms = xobject_scanner.filtered[key]
+        else:
+            for name in list(xobjects.keys()):
+                if xobject_scanner.is_watermark(xobjects[name]):
+                    logger.debug("移除水印XObject: %s", name)
+                    del xobjects[name]
+                    xobject_scanner.report.count("xobjects_dropped")
+                    forms += 1
+                elif xobjects[name].objgen in xobject_scanner.nested:
+                    # 保留的表单中嵌套的水印表单已被就地移除
+                    forms += xobject_scanner.nested[xobjects[name].objgen]
+            if key != (0, 0):
+                xobject_scanner.filtered[key] = forms
+        modified = forms > 0
     
-    for keyword in WATERMARK_KEYWORDS:
-        # 使用正则表达式查找所有匹配项
-        matches = re.findall(keyword, text, re.IGNORECASE)
-        if matches:
-            count = len(matches)
-            watermark_count += count
-            watermark_details[keyword] = count
+    if "/ExtGState" in resources:
+        # 移除透明度设置，这可能用于水印
+        del resources["/ExtGState"]
+        modified = True
     
-    return watermark_count, watermark_details
+    return modified, forms
+
+def _page_content_streams(page):
+    """返回页面的内容流列表"""
+    content_stream = page["/Contents"]
+    if isinstance(content_stream, pikepdf.Array):
+        return list(content_stream)
+    return [content_stream]
+
+def filter_page_contents(page, matcher, rewrite=True, reader=None, fingerprints=None,
+                         collect_templates=False, layers=None):
+    """过滤页面的全部内容流，按顺序返回每个流的 StreamFilterResult
+
+    只计算结果、不修改页面，可以在子进程中执行。无法解析的流保持原样，
+    其原始字节中的关键词计为残留。
+    """
+    if "/Contents" not in page:
+        return []
+    resources = page.get("/Resources")
+    text_state = TextState(resources, reader.fonts if reader is not None else None)
+    results = []
+    for obj in _page_content_streams(page):
+        try:
+            results.append(filter_content_stream(obj, matcher, rewrite, reader, fingerprints,
+                                                 collect_templates, resources, layers, text_state))
+        except Exception as e:
+            logger.warning("处理内容流时出错: %s", e)
+            residual = {}
+            try:
+                residual = matcher.count(reader.read_bytes(obj) if reader else obj.read_bytes())[1]
+            except Exception:
+                pass
+            results.append(StreamFilterResult(None, 0, {}, residual))
+    return results
+
+def extract_form_texts(xobject, reader=None, memo=None):
+    """提取表单及其嵌套表单的文本，返回 (文本, [嵌套表单的结果, ...])
+
+    带水印标记的表单文本为 None，不是表单的 XObject 返回 None。memo 按 objgen
+    缓存结果，多个页面共用的表单只提取一次，也能避免循环引用。
+    """
+    if xobject.get("/Subtype") != "/Form":
+        return None
+    if memo is None:
+        memo = {}
+    key = xobject.objgen
+    if key in memo:
+        return memo[key]
+    children = []
+    text = None
+    if not is_watermark_form_marked(xobject):
+        try:
+            text = extract_stream_text(xobject, reader, xobject.get("/Resources"))
+        except Exception as e:
+            logger.warning("处理XObject时出错: %s", e)
+            text = ""
+    memo[key] = (text, children)
+    resources = xobject.get("/Resources")
+    xobjects = resources.get("/XObject") if text is not None and resources is not None else None
+    if isinstance(xobjects, pikepdf.Dictionary):
+        for nested in list(xobjects.values()):
+            form = extract_form_texts(nested, reader, memo)
+            if form is not None:
+                children.append(form)
+    return memo[key]
+
+def count_form_texts(forms, matcher, visiting=None):
+    """统计 extract_form_texts 结果中的水印表单数，判定方式与 XObjectScanner 相同"""
+    if visiting is None:
+        visiting = set()
+    count = 0
+    for form in forms:
+        text, children = form
+        if text is None or matcher.search(text):
+            count += 1
+        elif id(form) not in visiting:
+            visiting.add(id(form))
+            count += count_form_texts(children, matcher, visiting)
+            visiting.discard(id(form))
+    return count
+
+def _annotation_texts(page, reader=None, memo=None):
+    """页面注释中与关键词匹配有关的内容，返回 (/Watermark 注释数, [(外观表单, 注释内容), ...])"""
+    annotations = page.get("/Annots")
+    if not isinstance(annotations, pikepdf.Array):
+        return 0, []
+    marked = 0
+    texts = []
+    for annotation in annotations:
+        if annotation.get("/Subtype") == "/Watermark":
+            marked += 1
+            continue
+        appearance = annotation.get("/AP")
+        normal = appearance.get("/N") if isinstance(appearance, pikepdf.Dictionary) else None
+        form = extract_form_texts(normal, reader, memo) if isinstance(normal, pikepdf.Stream) else None
+        contents = annotation.get("/Contents")
+        contents = str(contents) if isinstance(contents, pikepdf.String) else ""
+        if form is not None or contents:
+            texts.append((form, contents))
+    return marked, texts
+
+def extract_page_texts(page, reader=None, memo=None):
+    """提取页面中与关键词匹配有关的文本，换关键词后用 count_page_texts 重新统计，无需再解析
+
+    返回 {"texts", "forms", "annotations", "structural"}，统计口径与 iter_watermark_check 相同。
+    """
+    memo = {} if memo is None else memo
+    structural = {}
+    marked, annotations = _annotation_texts(page, reader, memo)
+    if marked:
+        structural[WATERMARK_ANNOTATION_LABEL] = marked
+    resources = page.get("/Resources")
+    forms = []
+    xobjects = resources.get("/XObject") if resources is not None else None
+    if isinstance(xobjects, pikepdf.Dictionary):
+        forms = [form for form in (extract_form_texts(xobject, reader, memo)
+                                   for xobject in list(xobjects.values())) if form is not None]
+    texts = []
+    record = {"texts": texts, "forms": forms, "annotations": annotations, "structural": structural}
+    if "/Contents" not in page:
+        return record
+    text_state = TextState(resources, reader.fonts if reader is not None else None)
+    for obj in _page_content_streams(page):
+        try:
+            data, instructions, report = _read_instructions(obj, reader)
+            instructions, artifacts = strip_structural_watermarks(data, instructions, resources, report=report)
+            merge_watermark_details(structural, artifacts)
+            texts.extend(item.text for item in iter_text_blocks(instructions, text_state)
+                         if isinstance(item, TextBlock))
+        except Exception as e:
+            logger.warning("提取页面文本时出错: %s", e)
+            try:
+                texts.append(reader.read_bytes(obj) if reader else obj.read_bytes())
+            except Exception:
+                pass
+    # 不显示文本的块对任何关键词都不会命中，不必保留
+    record["texts"] = [text for text in texts if text]
+    return record
+
+def iter_page_texts(pdf, progress=None):
+    """逐页提取文本的生成器，产出加上 "page"（页码）的 extract_page_texts 结果"""
+    reader = StreamReader(pdf)
+    memo = {}
+    total_pages = len(pdf.pages)
+    for i, page in enumerate(pdf.pages):
+        record = extract_page_texts(page, reader, memo)
+        record["page"] = i + 1
+        if progress is not None:
+            progress(i + 1, total_pages)
+        yield record
 
-def check_for_watermarks(pdf_path):
-    """检查PDF中是否存在水印，并详细统计每页的水印数量"""
+def count_page_texts(page_texts, matcher):
+    """统计 extract_page_texts 结果中的水印，返回 {关键词或标签: 次数}"""
+    details = dict(page_texts["structural"])
+    forms = count_form_texts(page_texts["forms"], matcher)
+    if forms:
+        details[WATERMARK_FORM_LABEL] = forms
+    annotations = sum(1 for form, contents in page_texts["annotations"]
+                      if (form is not None and (form[0] is None or matcher.search(form[0])))
+                      or matcher.search(contents))
+    if annotations:
+        merge_watermark_details(details, {WATERMARK_ANNOTATION_LABEL: annotations})
+    for text in page_texts["texts"]:
+        if matcher.search(text):
+            merge_watermark_details(details, matcher.count(text)[1])
+    return details
+
+def _new_content_stream(pdf, data, compress=False):
+    """新建内容流；compress 为 True 时立即压缩，保存前只在内存中保留压缩后的数据"""
+    if not compress:
+        return pikepdf.Stream(pdf, data)
+    stream = pikepdf.Stream(pdf, b"")
+    stream.write(zlib.compress(data), filter=Name.FlateDecode)
+    return stream
+
+def apply_page_contents(pdf, page, stream_results, stats, drop_residual=False, compress=False):
+    """把 filter_page_contents 的结果写回页面，返回页面是否被修改
+
+    drop_residual 为 True 时丢弃仍有残留水印的流；compress 为 True 时重写的流立即压缩。
+    """
+    content_stream = page["/Contents"]
+    streams = _page_content_streams(page)
+    
+    new_contents = []
+    contents_changed = False
+    for obj, result in zip(streams, stream_results):
+        if drop_residual and result.residual:
+            stats["streams_dropped"] += 1
+            contents_changed = True
+            continue
+        
+        if result.new_bytes is None:
+            stats["streams_unchanged"] += 1
+            new_contents.append(obj)
+            continue
+        
+        stats["streams_rewritten"] += 1
+        contents_changed = True
+        
+        # 多个内容流时丢弃被清空的流
+        if result.new_bytes.strip() or len(streams) == 1:
+            new_contents.append(_new_content_stream(pdf, result.new_bytes, compress))
+    
+    if contents_changed:
+        if isinstance(content_stream, pikepdf.Array) or not new_contents:
+            page["/Contents"] = pikepdf.Array(new_contents)
+        else:
+            page["/Contents"] = new_contents[0]
+    return contents_changed
+
+def _filter_page_range(input_path, keywords, start, stop, fingerprints=None, collect_templates=False,
+                       layers=None):
+    """子进程任务：过滤一段页面的内容流，只返回有改动或有残留的页面"""
+    matcher = get_keyword_matcher(keywords)
+    results = {}
+    with pikepdf.open(input_path) as pdf:
+        reader = StreamReader(pdf)
+        for index in range(start, stop):
+            stream_results = filter_page_contents(pdf.pages[index], matcher, reader=reader,
+                                                  fingerprints=fingerprints,
+                                                  collect_templates=collect_templates, layers=layers)
+            if any(result.new_bytes is not None or result.residual for result in stream_results):
+                results[index] = stream_results
+    return results
+
+def filter_contents_parallel(input_path, page_count, matcher, workers, fingerprints=None,
+                             collect_templates=False, layers=None):
+    """在进程池中按页面范围并行过滤内容流
+
+    返回 {页序号: filter_page_contents 的结果}，未出现的页面没有水印
+    """
+    # 进程池只在并行处理时导入，单进程运行和命令行启动不必加载 multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    
+    # 分片数多于进程数，让页面内容不均匀时各进程的负载也大致均衡
+    shard_size = max(1, -(-page_count // (workers * 4)))
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_filter_page_range, input_path, matcher.keywords,
+                            start, min(start + shard_size, page_count), fingerprints, collect_templates,
+                            layers)
+            for start in range(0, page_count, shard_size)
+        ]
+        for future in futures:
+            results.update(future.result())
+    return results
+
+def iter_removal(pdf, progress=None, keywords=None, stats=None, rebuild=False, parallel_results=None,
+                 run_report=None, low_memory=False, fingerprints=None, templates=None, layers=None,
+                 strip_layers=False):
+    """在已打开的PDF上就地移除水印的生成器，每处理完一页产出该页的记录，不打印
+
+    记录包含 page、found、residual、modified 和 rebuilt；文档级别的清理在生成器耗尽时进行。
+    """
+    matcher = get_keyword_matcher(keywords)
+    if run_report is None:
+        run_report = NULL_REPORT
+    if stats is None:
+        stats = {}
+    for key in ("streams_rewritten", "streams_unchanged", "streams_dropped", "annotations_removed",
+                "watermark_layers"):
+        stats[key] = 0
+    cache = DecodedStreamCache(0) if low_memory else None
+    reader = StreamReader(pdf, cache, run_report=run_report)
+    collect_templates = templates is not None
+    
+    # 0. 在图层配置中关闭水印图层，只修改文档目录，与页数无关
+    layer_keys = None
+    if layers:
+        stats["watermark_layers"] = hide_watermark_layers(pdf, layers)
+        if strip_layers:
+            layer_keys = layer_objgens(layers)
+    xobject_scanner = XObjectScanner(matcher, reader, fingerprints, collect_templates, layer_keys)
+    
+    # 1. 移除资源中的水印XObject和图形状态参数字典
+    # 多个页面共用的资源字典只处理一次，并保持共用关系
+    resource_index = index_page_resources(pdf)
+    resource_modified_pages = set()
+    resource_forms = {}
+    with run_report.stage("resources"):
+        for resources, page_numbers in resource_index.values():
+            modified, forms = filter_resources(resources, xobject_scanner)
+            if modified:
+                resource_modified_pages.update(page_numbers)
+            if forms:
+                resource_forms.update((page_number, forms) for page_number in page_numbers)
+    stats["forms_scanned"] = xobject_scanner.forms_scanned
+    if collect_templates:
+        templates.extend(xobject_scanner.templates)
+    
+    total_pages = len(pdf.pages)
+    for i, page in enumerate(pdf.pages):
+        page_start = time.perf_counter()
+        page_num = i + 1
+        page_modified = page_num in resource_modified_pages
+        
+        # 2. 处理内容流，逐条解析指令，只移除包含水印关键词的文本块
+        if parallel_results is not None:
+            stream_results = parallel_results.get(i, [])
+            if not stream_results and "/Contents" in page:
+                # 子进程只返回有改动的页面，其余页面的流都原样保留
+                stats["streams_unchanged"] += len(_page_content_streams(page))
+        else:
+            stream_results = filter_page_contents(page, matcher, reader=reader, fingerprints=fingerprints,
+                                                  collect_templates=collect_templates, layers=layer_keys)
+        
+        found = {}
+        if page_num in resource_forms:
+            found[WATERMARK_FORM_LABEL] = resource_forms[page_num]
+        residual = {}
+        for result in stream_results:
+            merge_watermark_details(found, result.found)
+            merge_watermark_details(residual, result.residual)
+            if collect_templates:
+                templates.extend(result.templates)
+        
+        # 内存中校验：只有仍残留水印的页面才需要重建
+        rebuilt = rebuild and bool(residual)
+        if stream_results and apply_page_contents(pdf, page, stream_results, stats,
+                                                  drop_residual=rebuilt, compress=low_memory):
+            logger.debug("在页面 %d 中移除包含水印的文本块", page_num)
+            page_modified = True
+        
+        # 3. 移除页面中的水印注释，链接等其他注释保留
+        annotations_removed = filter_annotations(page, xobject_scanner)
+        if annotations_removed:
+            merge_watermark_details(found, {WATERMARK_ANNOTATION_LABEL: annotations_removed})
+            stats["annotations_removed"] += annotations_removed
+            page_modified = True
+        
+        # 4. 移除页面中的所有可能包含水印的元数据
+        for key in ["/Metadata", "/PieceInfo"]:
+            if key in page:
+                del page[key]
+                page_modified = True
+        
+        run_report.page_done(time.perf_counter() - page_start)
+        if progress is not None:
+            progress(page_num, total_pages)
+        yield {
+            "page": page_num,
+            "found": found,
+            "residual": residual,
+            "modified": page_modified,
+            "rebuilt": rebuilt,
+        }
+    
+    # 5. 移除文档级别的元数据
+    if "/Metadata" in pdf.Root:
+        del pdf.Root["/Metadata"]
+    
+    # 6. 移除文档信息字典
+    if "/Info" in pdf.trailer:
+        del pdf.trailer["/Info"]
+    
+    # remove_unreferenced_resources 会为每个页面复制共用的资源字典，
+    # 只在没有共用资源时调用，避免输出中出现 N 份相同的资源表
+    if all(len(pages) == 1 for _, pages in resource_index.values()):
+        with run_report.stage("remove_unreferenced"):
+            pdf.remove_unreferenced_resources()
+    
+    for key, value in stats.items():
+        run_report.count(key, value)
+
+def _parallel_results_for(input_path, pdf, matcher, workers, run_report=NULL_REPORT, fingerprints=None,
+                          collect_templates=False, layers=None):
+    """workers 大于 1 且输入为文件路径时，在进程池中预先过滤所有页面"""
+    if workers > 1 and len(pdf.pages) > 1 and isinstance(input_path, (str, os.PathLike)):
+        with run_report.stage("parallel_filter"):
+            return filter_contents_parallel(input_path, len(pdf.pages), matcher, workers, fingerprints,
+                                            collect_templates, layers)
+    return None
+
+def find_repeated_content(pdf, fraction=REPEATED_CONTENT_FRACTION, run_report=NULL_REPORT, low_memory=False,
+                          matcher=None):
+    """不依赖关键词，找出在大部分页面上重复出现的文本块和表单
+
+    返回 {指纹: {REPEATED_CONTENT_LABEL: 1}}。给出 matcher 时排除本身包含
+    关键词的文本块，它们仍按关键词移除和计数。
+    """
+    cache = DecodedStreamCache(0) if low_memory else None
+    with run_report.stage("fingerprint"):
+        index = build_fingerprint_index(pdf, StreamReader(pdf, cache, run_report=run_report))
+        fingerprints = index.candidates(fraction)
+    if matcher is not None:
+        fingerprints = {fingerprint: details for fingerprint, details in fingerprints.items()
+                        if index.kinds[fingerprint] != "block" or not matcher.search(index.samples[fingerprint])}
+    run_report.count("repeated_content", len(fingerprints))
+    for record in index.describe(fingerprints):
+        logger.info("重复内容（%s，%d 页）: %s", record["kind"], record["pages"], record["sample"])
+    return fingerprints
+
+def active_templates(template_store, matcher):
+    """模板库中适用于当前关键词的模板，返回 {指纹: {关键词: 次数}}
+
+    模板当初匹配到的关键词至少有一个仍在 matcher 中时才生效；从关键词列表
+    中删除的关键词，其积累的模板也随之停用。
+    """
+    current = {keyword.lower() for keyword in matcher.keywords}
+    return {fingerprint: details for fingerprint, details in template_store.templates().items()
+            if any(keyword.lower() in current for keyword in details)}
+
+def _removal_fingerprints(pdf, matcher, repeated_fraction, template_store, run_report, low_memory):
+    """合并模板库中的已知水印和重复内容检测的结果，都没有时返回 None"""
+    fingerprints = {}
+    if template_store is not None:
+        fingerprints.update(active_templates(template_store, matcher))
+    if repeated_fraction is not None:
+        for fingerprint, details in find_repeated_content(pdf, repeated_fraction, run_report,
+                                                          low_memory, matcher).items():
+            fingerprints.setdefault(fingerprint, details)
+    return fingerprints or None
+
+def result_cache_key(result_cache, input_path, output_path, step, repeated_fraction, watermark_layers="hide",
+                     template_store=None):
+    """计算结果缓存的键；不使用缓存或输入、输出不是文件路径时返回 None
+
+    键只记录是否使用模板库，不随模板库的内容变化：模板按当前关键词筛选，
+    关键词已计入键，模板库积累新模板后仍沿用已缓存的结果。
+    """
+    if result_cache is None or not all(isinstance(path, (str, os.PathLike)) for path in (input_path, output_path)):
+        return None
+    version = f"{__version__}/pikepdf-{pikepdf.__version__}"
+    options = {
+        "step": step,
+        "repeated_fraction": repeated_fraction,
+        "watermark_layers": watermark_layers,
+        "templates": template_store is not None,
+    }
+    return result_cache.key_for(input_path, get_watermark_keywords(), version, options)
+
+def _cached_result(result_cache, cache_key, output_path, stats, run_report):
+    """查找结果缓存，命中时把缓存的输出复制到 output_path 并返回缓存的结果"""
+    if cache_key is None:
+        return None
+    cached = result_cache.get(cache_key, output_path)
+    if cached is not None:
+        run_report.count("result_cache_hits")
+        stats.update(cached["stats"])
+        print(f"命中结果缓存，已保存PDF到: {output_path}")
+    return cached
+
+def _store_result(result_cache, cache_key, output_path, result):
     try:
-        with pikepdf.open(pdf_path) as pdf:
+        result_cache.put(cache_key, output_path, result)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning("写入结果缓存时出错: %s", e)
+
+def learn_templates(template_store, templates, run_report=NULL_REPORT):
+    """把一次成功运行中按关键词移除的文本块和表单加入模板库，同一指纹只写一次"""
+    unique = {}
+    for template in templates:
+        unique.setdefault(template[1], template)
+    try:
+        added = template_store.add_templates(unique.values())
+    except Exception as e:
+        logger.warning("写入水印模板库时出错: %s", e)
+        return 0
+    run_report.count("templates_added", added)
+    logger.info("水印模板库新增 %d 个模板", added)
+    return added
+
+def open_pdf(input_path, run_report=NULL_REPORT, low_memory=False):
+    """打开PDF，并把耗时计入报告的 open 阶段
+
+    low_memory 为 True 且输入为文件路径时使用内存映射读取，文件内容由操作
+    系统按需换入换出，不占用进程堆内存。
+    """
+    with run_report.stage("open"):
+        if low_memory and isinstance(input_path, (str, os.PathLike)):
+            return pikepdf.open(input_path, access_mode=pikepdf.AccessMode.mmap)
+        return pikepdf.open(input_path)
+
+def _watermark_layers_for(pdf, matcher, watermark_layers, run_report=NULL_REPORT):
+    """按处理方式查找水印图层，返回 (图层列表, 传给页面过滤的 objgen 集合或 None)"""
+    if watermark_layers not in LAYER_MODES:
+        raise ValueError(f"未知的图层处理方式: {watermark_layers}")
+    if watermark_layers is None:
+        return [], None
+    layers = find_watermark_layers(pdf, matcher)
+    run_report.count("watermark_layers_found", len(layers))
+    return layers, layer_objgens(layers) if layers and watermark_layers == "strip" else None
+
+def save_pdf(pdf, output_path, run_report=NULL_REPORT):
+    """保存PDF，并把耗时计入报告的 save 阶段"""
+    with run_report.stage("save"):
+        pdf.save(output_path)
+
+def console_progress(label):
+    """返回在控制台同一行刷新进度的回调"""
+    def progress(done, total):
+        print(f"\r{label} {done}/{total}", end="")
+    return progress
+
+def iter_watermark_check(pdf, progress=None, keywords=None, run_report=None, low_memory=False,
+                         fingerprints=None):
+    """逐页检查水印的生成器，产出 {"page", "count", "details"}，与移除使用同一套解析和匹配，不修改文档"""
+    matcher = get_keyword_matcher(keywords)
+    if run_report is None:
+        run_report = NULL_REPORT
+    cache = DecodedStreamCache(0) if low_memory else None
+    reader = StreamReader(pdf, cache, run_report=run_report)
+    xobject_scanner = XObjectScanner(matcher, reader, fingerprints, remove=False)
+    total_pages = len(pdf.pages)
+    for i, page in enumerate(pdf.pages):
+        page_start = time.perf_counter()
+        # 统计页面中的水印数量，与移除时使用同一套解析和匹配
+        details = {}
+        forms = xobject_scanner.count_forms(page.get("/Resources"))
+        if forms:
+            details[WATERMARK_FORM_LABEL] = forms
+        for result in filter_page_contents(page, matcher, rewrite=False, reader=reader,
+                                           fingerprints=fingerprints):
+            merge_watermark_details(details, result.found)
+            merge_watermark_details(details, result.residual)
+        annotations = count_watermark_annotations(page, xobject_scanner)
+        if annotations:
+            details[WATERMARK_ANNOTATION_LABEL] = annotations
+        
+        run_report.page_done(time.perf_counter() - page_start)
+        if progress is not None:
+            progress(i + 1, total_pages)
+        yield {"page": i + 1, "count": sum(details.values()), "details": details}
+
+def sample_page_indices(total_pages, sample_size, strategy="stride", seed=None):
+    """按抽样方式选出待检查的页序号（从 0 开始，升序）"""
+    if strategy not in SAMPLING_STRATEGIES:
+        raise ValueError(f"未知的抽样方式: {strategy}")
+    if sample_size < 1:
+        raise ValueError(f"抽样页数必须大于 0: {sample_size}")
+    sample_size = min(sample_size, total_pages)
+    if strategy == "first":
+        return list(range(sample_size))
+    if strategy == "stride":
+        return [i * total_pages // sample_size for i in range(sample_size)]
+    return sorted(random.Random(seed).sample(range(total_pages), sample_size))
+
+def wilson_interval(hits, trials, confidence=0.95):
+    """比例的 Wilson 置信区间，返回 (下限, 上限)"""
+    if trials == 0:
+        return 0.0, 1.0
+    from statistics import NormalDist
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = hits / trials
+    denominator = 1 + z * z / trials
+    center = (p + z * z / (2 * trials)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+def quick_check_watermarks(pdf_path, sample_size=QUICK_CHECK_SAMPLE, strategy="stride", seed=None,
+                           stop_on_hit=True, confidence=0.95, keywords=None):
+    """抽样检查PDF中是否有水印，返回抽样结果、有水印页数的估计及其置信区间
+
+    stop_on_hit 为 True 时发现第一处水印即停止，估计只基于已检查的页面。
+    """
+    matcher = get_keyword_matcher(keywords)
+    with pikepdf.open(pdf_path) as pdf:
+        total_pages = len(pdf.pages)
+        layers = layer_names(find_watermark_layers(pdf, matcher))
+        sample = sample_page_indices(total_pages, sample_size, strategy, seed)
+        indices = [] if layers and stop_on_hit else sample
+        reader = StreamReader(pdf)
+        scanner = XObjectScanner(matcher, reader, remove=False)
+        hit_pages = []
+        details = {}
+        pages_scanned = 0
+        for index in indices:
+            page = pdf.pages[index]
+            pages_scanned += 1
+            page_details = {}
+            # 水印注释只看结构，有水印注释的页面不必再解析内容流
+            annotations = count_watermark_annotations(page)
+            if annotations:
+                page_details[WATERMARK_ANNOTATION_LABEL] = annotations
+            else:
+                for result in filter_page_contents(page, matcher, rewrite=False, reader=reader):
+                    merge_watermark_details(page_details, result.found)
+                    merge_watermark_details(page_details, result.residual)
+            forms = scanner.count_forms(page.get("/Resources"))
+            if forms:
+                page_details[WATERMARK_FORM_LABEL] = forms
+            if page_details:
+                hit_pages.append(index + 1)
+                merge_watermark_details(details, page_details)
+                if stop_on_hit:
+                    break
+    
+    hits = len(hit_pages)
+    if pages_scanned == total_pages:
+        low, high = hits / max(total_pages, 1), hits / max(total_pages, 1)
+    else:
+        low, high = wilson_interval(hits, pages_scanned, confidence)
+    if hits or layers or pages_scanned == total_pages:
+        detection_confidence = 1.0
+    else:
+        detection_confidence = 1 - (1 - QUICK_CHECK_MIN_FRACTION) ** pages_scanned
+    return {
+        "has_watermarks": bool(hits or layers),
+        "total_pages": total_pages,
+        "pages_scanned": pages_scanned,
+        "stopped_early": pages_scanned < len(sample),
+        "strategy": strategy,
+        "hit_pages": hit_pages,
+        "details": details,
+        "estimated_pages": round(hits / pages_scanned * total_pages) if pages_scanned else 0,
+        # 已检查的页面是确定的：区间至少包含已发现的页，不包含已确认没有水印的页
+        "interval": (max(hits, math.floor(low * total_pages)),
+                     min(total_pages - (pages_scanned - hits), math.ceil(high * total_pages))),
+        "confidence": confidence,
+        "detection_confidence": round(detection_confidence, 6),
+        "watermark_layers": layers,
+    }
+
+def check_for_watermarks(pdf_path, run_report=None, low_memory=False, template_store=None):
+    """检查PDF中是否存在水印，并详细统计每页的水印数量，每个水印图层计为一处"""
+    if run_report is None:
+        run_report = NULL_REPORT
+    run_report.start()
+    try:
+        with open_pdf(pdf_path, run_report, low_memory) as pdf:
             total_watermark_count = 0
             pages_with_watermarks = set()
             watermarks_per_page = {}
             
             print(f"检查文件中的水印: {pdf_path}")
             
-            for i, page in enumerate(pdf.pages):
-                page_num = i + 1
-                print(f"\r检查页面 {page_num}/{len(pdf.pages)}", end="")
-                
-                # 提取页面文本
-                text = ""
-                try:
-                    # 尝试获取页面内容
-                    if page.get("/Contents") is not None:
-                        content_stream = page.get("/Contents")
-                        if isinstance(content_stream, list):
-                            for obj in content_stream:
-                                text += obj.read_bytes().decode('utf-8', errors='ignore')
-                        else:
-                            text += content_stream.read_bytes().decode('utf-8', errors='ignore')
-                except Exception as e:
-                    print(f"\n提取页面 {page_num} 文本时出错: {str(e)}")
-                
-                # 统计页面中的水印数量
-                page_watermark_count, watermark_details = count_watermarks_in_text(text)
-                
-                if page_watermark_count > 0:
-                    total_watermark_count += page_watermark_count
+            fingerprints = None
+            if template_store is not None:
+                fingerprints = active_templates(template_store, get_keyword_matcher())
+            for record in iter_watermark_check(pdf, console_progress("检查页面"), run_report=run_report,
+                                               low_memory=low_memory, fingerprints=fingerprints):
+                if record["count"] > 0:
+                    page_num = record["page"]
+                    total_watermark_count += record["count"]
                     pages_with_watermarks.add(page_num)
-                    watermarks_per_page[page_num] = (page_watermark_count, watermark_details)
+                    watermarks_per_page[page_num] = (record["count"], record["details"])
+            
+            # 水印图层是文档级别的，每个图层计为一处水印
+            layers = layer_names(find_watermark_layers(pdf, get_keyword_matcher()))
+            total_watermark_count += len(layers)
             
             print(f"\n\n检查完成: 发现总计 {total_watermark_count} 处水印，在 {len(pages_with_watermarks)} 个页面")
             
@@ -111,186 +1597,185 @@ def check_for_watermarks(pdf_path):
             if pages_with_watermarks:
                 print(f"\n包含水印的页面: {', '.join(map(str, sorted(pages_with_watermarks)))}")
             
+            if layers:
+                print(f"\n水印图层（{WATERMARK_LAYER_LABEL}）: {', '.join(layers)}")
+            
             return total_watermark_count, pages_with_watermarks, watermarks_per_page
     except Exception as e:
         print(f"检查水印时出错: {str(e)}")
         return 0, set(), {}
+    finally:
+        run_report.stop()
 
-def extreme_watermark_removal(input_path, output_path):
-    """使用极端方法移除所有形式的水印，包括半透明背景水印"""
+def _remove_and_report(input_path, output_path, *, step, rebuild, stats, workers, run_report, low_memory,
+                       repeated_fraction, template_store, result_cache, watermark_layers):
+    """两个移除入口共用的流程，返回 remove_watermarks_pipeline 格式的处理报告
+
+    先查找结果缓存；未命中时准备指纹和水印图层，逐页移除并保存，然后更新
+    模板库和结果缓存。
+    """
+    matcher = get_keyword_matcher()
+    cache_key = result_cache_key(result_cache, input_path, output_path, step, repeated_fraction,
+                                 watermark_layers, template_store)
+    cached = _cached_result(result_cache, cache_key, output_path, stats, run_report)
+    if cached is not None:
+        return cached
+    
+    with open_pdf(input_path, run_report, low_memory) as pdf:
+        if low_memory:
+            # 并行结果需要同时保存所有页面的新内容
+            workers = 1
+        fingerprints = _removal_fingerprints(pdf, matcher, repeated_fraction, template_store,
+                                             run_report, low_memory)
+        templates = [] if template_store is not None else None
+        layers, layer_keys = _watermark_layers_for(pdf, matcher, watermark_layers, run_report)
+        names = layer_names(layers)
+        if names:
+            print(f"发现水印图层: {', '.join(names)}")
+        parallel_results = _parallel_results_for(input_path, pdf, matcher, workers, run_report, fingerprints,
+                                                 templates is not None, layer_keys)
+        # 只保留有水印页面的记录，其余页面只计数
+        watermark_pages = []
+        pages_modified = 0
+        rebuilt_pages = []
+        for record in iter_removal(pdf, console_progress("处理页面"), stats=stats, rebuild=rebuild,
+                                   parallel_results=parallel_results, run_report=run_report,
+                                   low_memory=low_memory, fingerprints=fingerprints, templates=templates,
+                                   layers=layers, strip_layers=layer_keys is not None):
+            if record["found"] or record["residual"]:
+                watermark_pages.append(record)
+            if record["modified"]:
+                pages_modified += 1
+            if record["rebuilt"]:
+                rebuilt_pages.append(record["page"])
+        save_pdf(pdf, output_path, run_report)
+        if templates:
+            learn_templates(template_store, templates, run_report)
+    
+    report = {
+        # 每个水印图层计为一处水印
+        "watermarks": sum(sum(record["found"].values()) + sum(record["residual"].values())
+                          for record in watermark_pages) + len(names),
+        "pages_with_watermarks": [record["page"] for record in watermark_pages],
+        "pages_modified": pages_modified,
+        "residual_watermarks": sum(sum(record["residual"].values()) for record in watermark_pages),
+        "rebuilt_pages": rebuilt_pages,
+        "watermark_layers": names,
+        "stats": stats,
+        "pages": watermark_pages,
+    }
+    if cache_key is not None:
+        _store_result(result_cache, cache_key, output_path, report)
+    
+    print(f"\n\n成功保存PDF到: {output_path}")
+    print(f"已修改 {pages_modified} 页")
+    if names:
+        print(f"已关闭 {len(names)} 个水印图层")
+    return report
+
+def extreme_watermark_removal(input_path, output_path, stats=None, workers=1, run_report=None,
+                              low_memory=False, repeated_fraction=None, template_store=None,
+                              result_cache=None, watermark_layers="hide"):
+    """使用极端方法移除所有形式的水印，包括半透明背景水印，返回修改的页数"""
+    if stats is None:
+        stats = {}
+    if run_report is None:
+        run_report = NULL_REPORT
+    run_report.start()
     try:
-        with pikepdf.open(input_path) as pdf:
-            modified_pages = 0
-            
-            for i, page in enumerate(pdf.pages):
-                page_num = i + 1
-                print(f"\r处理页面 {page_num}/{len(pdf.pages)}", end="")
-                page_modified = False
-                
-                # 1. 移除页面中的所有XObject（可能包含水印图像）
-                if "/Resources" in page:
-                    resources = page["/Resources"]
-                    
-                    # 处理XObject资源
-                    if "/XObject" in resources:
-                        # 保存原始XObject引用
-                        original_xobjects = resources["/XObject"]
-                        
-                        # 创建新的XObject字典，只保留不包含水印的对象
-                        new_xobjects = pikepdf.Dictionary()
-                        for name, xobject in original_xobjects.items():
-                            keep_object = True
-                            
-                            try:
-                                # 检查XObject内容
-                                if xobject.get("/Subtype") == "/Form":
-                                    # 尝试读取XObject内容
-                                    content = ""
-                                    try:
-                                        if "/Contents" in xobject:
-                                            content = xobject["/Contents"].read_bytes().decode('utf-8', errors='ignore')
-                                        else:
-                                            content = xobject.read_bytes().decode('utf-8', errors='ignore')
-                                    except:
-                                        pass
-                                    
-                                    # 检查是否包含水印关键词
-                                    for keyword in WATERMARK_KEYWORDS:
-                                        if keyword.lower() in content.lower():
-                                            keep_object = False
-                                            debug_print(f"移除页面 {page_num} 中的水印XObject: {name}")
-                                            page_modified = True
-                                            break
-                            except Exception as e:
-                                debug_print(f"处理XObject时出错: {str(e)}")
-                            
-                            # 如果不包含水印，保留该对象
-                            if keep_object:
-                                new_xobjects[name] = xobject
-                        
-                        # 更新资源字典中的XObject
-                        resources["/XObject"] = new_xobjects
-                
-                # 2. 处理内容流，只移除包含水印关键词的文本块
-                if "/Contents" in page:
-                    content_stream = page["/Contents"]
-                    
-                    if isinstance(content_stream, list):
-                        new_contents = []
-                        
-                        for obj in content_stream:
-                            try:
-                                content_bytes = obj.read_bytes()
-                                content_str = content_bytes.decode('utf-8', errors='ignore')
-                                
-                                # 找到所有文本块（BT...ET之间的内容）
-                                text_blocks = re.findall(r'(BT.*?ET)', content_str, flags=re.DOTALL)
-                                modified_content = content_str
-                                
-                                for block in text_blocks:
-                                    # 检查文本块是否包含水印关键词
-                                    contains_watermark = False
-                                    for keyword in WATERMARK_KEYWORDS:
-                                        if keyword.lower() in block.lower():
-                                            contains_watermark = True
-                                            break
-                                    
-                                    # 只删除包含水印关键词的文本块
-                                    if contains_watermark:
-                                        modified_content = modified_content.replace(block, '')
-                                        debug_print(f"在页面 {page_num} 中移除包含水印的文本块")
-                                        page_modified = True
-                                
-                                # 如果内容有变化，添加到新内容列表
-                                if modified_content.strip():
-                                    new_contents.append(pikepdf.Stream(pdf, modified_content.encode('utf-8')))
-                            except Exception as e:
-                                debug_print(f"处理内容流时出错: {str(e)}")
-                                new_contents.append(obj)
-                        
-                        if new_contents:
-                            page["/Contents"] = new_contents
-                    else:
-                        try:
-                            content_bytes = content_stream.read_bytes()
-                            content_str = content_bytes.decode('utf-8', errors='ignore')
-                            
-                            # 找到所有文本块（BT...ET之间的内容）
-                            text_blocks = re.findall(r'(BT.*?ET)', content_str, flags=re.DOTALL)
-                            modified_content = content_str
-                            
-                            for block in text_blocks:
-                                # 检查文本块是否包含水印关键词
-                                contains_watermark = False
-                                for keyword in WATERMARK_KEYWORDS:
-                                    if keyword.lower() in block.lower():
-                                        contains_watermark = True
-                                        break
-                                
-                                # 只删除包含水印关键词的文本块
-                                if contains_watermark:
-                                    modified_content = modified_content.replace(block, '')
-                                    debug_print(f"在页面 {page_num} 中移除包含水印的文本块")
-                                    page_modified = True
-                            
-                            # 如果内容有变化，更新内容流
-                            if modified_content.strip():
-                                page["/Contents"] = pikepdf.Stream(pdf, modified_content.encode('utf-8'))
-                        except Exception as e:
-                            debug_print(f"处理内容流时出错: {str(e)}")
-                
-                # 3. 移除页面中的所有注释（可能包含水印）
-                if "/Annots" in page:
-                    del page["/Annots"]
-                    page_modified = True
-                
-                # 4. 移除页面中的所有可能包含水印的元数据
-                for key in ["/Metadata", "/PieceInfo"]:
-                    if key in page:
-                        del page[key]
-                        page_modified = True
-                
-                # 5. 处理页面的图形状态参数字典
-                if "/Resources" in page and "/ExtGState" in page["/Resources"]:
-                    # 移除透明度设置，这可能用于水印
-                    del page["/Resources"]["/ExtGState"]
-                    page_modified = True
-                
-                if page_modified:
-                    modified_pages += 1
-            
-            # 6. 移除文档级别的元数据
-            if "/Metadata" in pdf.Root:
-                del pdf.Root["/Metadata"]
-            
-            # 7. 移除文档信息字典
-            if "/Info" in pdf.trailer:
-                del pdf.trailer["/Info"]
-            
-            # 保存修改后的PDF
-            pdf.remove_unreferenced_resources()
-            pdf.save(output_path)
-            
-            print(f"\n\n成功保存PDF到: {output_path}")
-            print(f"已修改 {modified_pages} 页")
-            
-            return modified_pages
+        report = _remove_and_report(input_path, output_path, step="extreme", rebuild=False, stats=stats,
+                                    workers=workers, run_report=run_report, low_memory=low_memory,
+                                    repeated_fraction=repeated_fraction, template_store=template_store,
+                                    result_cache=result_cache, watermark_layers=watermark_layers)
+        print(f"重写内容流 {stats['streams_rewritten']} 个，原样保留 {stats['streams_unchanged']} 个")
+        return report["pages_modified"]
     except Exception as e:
         print(f"移除水印时出错: {str(e)}")
         return 0
+    finally:
+        run_report.stop()
+
+def remove_watermarks_pipeline(input_path, output_path, stats=None, workers=1, run_report=None,
+                               low_memory=False, repeated_fraction=None, template_store=None,
+                               result_cache=None, watermark_layers="hide"):
+    """一次遍历完成水印检测、移除、校验和重建，返回处理报告，出错时返回 None
 
-def create_clean_pdf(input_path, output_path):
-    """创建一个全新的PDF，只保留原始内容，彻底移除水印"""
+    仍残留水印的页面丢弃其内容流。参数与 extreme_watermark_removal 相同。
+    """
+    if stats is None:
+        stats = {}
+    if run_report is None:
+        run_report = NULL_REPORT
+    run_report.start()
     try:
-        # 创建一个临时文件路径
-        temp_path = output_path + ".temp.pdf"
-        
-        # 首先使用极端方法处理水印
-        extreme_watermark_removal(input_path, temp_path)
-        
-        # 然后创建一个全新的PDF，只保留文本和图像内容
-        with pikepdf.open(temp_path) as src_pdf:
+        return _remove_and_report(input_path, output_path, step="pipeline", rebuild=True, stats=stats,
+                                  workers=workers, run_report=run_report, low_memory=low_memory,
+                                  repeated_fraction=repeated_fraction, template_store=template_store,
+                                  result_cache=result_cache, watermark_layers=watermark_layers)
+    except Exception as e:
+        print(f"处理PDF时出错: {str(e)}")
+        return None
+    finally:
+        run_report.stop()
+
+def remove_watermark_layers(input_path, output_path, run_report=None):
+    """只在图层配置中关闭水印图层并保存，不解析任何页面内容
+
+    耗时与页数无关，适合水印只在图层中的文档。返回关闭的图层名称列表
+    （没有水印图层时为空列表，输出与输入内容相同），出错时返回 None。
+    """
+    if run_report is None:
+        run_report = NULL_REPORT
+    run_report.start()
+    try:
+        with open_pdf(input_path, run_report) as pdf:
+            layers, _ = _watermark_layers_for(pdf, get_keyword_matcher(), "hide", run_report)
+            names = layer_names(layers)
+            hide_watermark_layers(pdf, layers)
+            save_pdf(pdf, output_path, run_report)
+        print(f"已关闭 {len(names)} 个水印图层，保存PDF到: {output_path}")
+        return names
+    except Exception as e:
+        print(f"关闭水印图层时出错: {str(e)}")
+        return None
+    finally:
+        run_report.stop()
+
+def copy_object_to(pdf, obj):
+    """把另一个文档中的对象复制到 pdf 中
+
+    间接对象使用 copy_foreign 复制（流保留原始压缩数据），直接的字典和数组
+    逐项复制，其中引用的间接对象同样被复制。
+    """
+    if not isinstance(obj, pikepdf.Object):
+        return obj
+    if obj.is_indirect:
+        return pdf.copy_foreign(obj)
+    if isinstance(obj, pikepdf.Dictionary):
+        return pikepdf.Dictionary({key: copy_object_to(pdf, value) for key, value in obj.items()})
+    if isinstance(obj, pikepdf.Array):
+        return pikepdf.Array([copy_object_to(pdf, item) for item in obj])
+    return obj
+
+def create_clean_pdf(input_path, output_path, run_report=None):
+    """创建一个全新的PDF，只保留原始内容，彻底移除水印
+
+    极端移除直接在已打开的文档上进行，页面随后复制到新文档中，
+    中间不写临时文件，也不重新解析。
+    """
+    matcher = get_keyword_matcher()
+    if run_report is None:
+        run_report = NULL_REPORT
+    run_report.start()
+    try:
+        with open_pdf(input_path, run_report) as src_pdf:
+            # 首先在内存中使用极端方法处理水印
+            for _ in iter_removal(src_pdf, console_progress("处理页面"), run_report=run_report):
+                pass
+            
+            # 然后创建一个全新的PDF，只保留文本和图像内容
             dst_pdf = pikepdf.new()
+            reader = StreamReader(src_pdf, run_report=run_report)
             
             # 复制每一页，但只保留必要的内容
             for i, src_page in enumerate(src_pdf.pages):
@@ -299,77 +1784,32 @@ def create_clean_pdf(input_path, output_path):
                 
                 # 创建新页面
                 dst_page = dst_pdf.add_blank_page(
-                    width=src_page.MediaBox[2],
-                    height=src_page.MediaBox[3]
+                    page_size=(src_page.MediaBox[2], src_page.MediaBox[3])
                 )
                 
                 # 复制页面的基本属性
                 for key in ["/MediaBox", "/CropBox", "/Rotate"]:
                     if key in src_page:
-                        dst_page[key] = src_page[key]
+                        dst_page[key] = copy_object_to(dst_pdf, src_page[key])
                 
                 # 创建新的资源字典
                 dst_page["/Resources"] = pikepdf.Dictionary()
                 
                 # 复制字体资源
                 if "/Resources" in src_page and "/Font" in src_page["/Resources"]:
-                    dst_page["/Resources"]["/Font"] = src_page["/Resources"]["/Font"]
+                    dst_page["/Resources"]["/Font"] = copy_object_to(dst_pdf, src_page["/Resources"]["/Font"])
                 
-                # 复制内容流，但过滤掉水印
+                # 复制内容流，但丢弃仍然包含水印的流；保留的流连同原始压缩数据一起复制
                 if "/Contents" in src_page:
-                    content_stream = src_page["/Contents"]
-                    
-                    if isinstance(content_stream, list):
-                        new_contents = []
-                        
-                        for obj in content_stream:
-                            try:
-                                content_bytes = obj.read_bytes()
-                                content_str = content_bytes.decode('utf-8', errors='ignore')
-                                
-                                # 检查是否包含水印关键词
-                                contains_watermark = False
-                                for keyword in WATERMARK_KEYWORDS:
-                                    if keyword.lower() in content_str.lower():
-                                        contains_watermark = True
-                                        break
-                                
-                                # 如果不包含水印，保留该内容
-                                if not contains_watermark:
-                                    new_contents.append(pikepdf.Stream(dst_pdf, content_bytes))
-                            except:
-                                # 如果处理出错，保留原始内容
-                                new_contents.append(pikepdf.Stream(dst_pdf, obj.read_bytes()))
-                        
-                        if new_contents:
-                            dst_page["/Contents"] = new_contents
-                    else:
-                        try:
-                            content_bytes = content_stream.read_bytes()
-                            content_str = content_bytes.decode('utf-8', errors='ignore')
-                            
-                            # 检查是否包含水印关键词
-                            contains_watermark = False
-                            for keyword in WATERMARK_KEYWORDS:
-                                if keyword.lower() in content_str.lower():
-                                    contains_watermark = True
-                                    break
-                            
-                            # 如果不包含水印，保留该内容
-                            if not contains_watermark:
-                                dst_page["/Contents"] = pikepdf.Stream(dst_pdf, content_bytes)
-                        except:
-                            # 如果处理出错，保留原始内容
-                            dst_page["/Contents"] = pikepdf.Stream(dst_pdf, content_stream.read_bytes())
+                    new_contents = []
+                    stream_results = filter_page_contents(src_page, matcher, rewrite=False, reader=reader)
+                    for obj, result in zip(_page_content_streams(src_page), stream_results):
+                        if not result.found and not result.residual:
+                            new_contents.append(dst_pdf.copy_foreign(obj))
+                    dst_page["/Contents"] = pikepdf.Array(new_contents)
             
             # 保存新的PDF
-            dst_pdf.save(output_path)
-            
-            # 删除临时文件
-            try:
-                os.remove(temp_path)
-            except:
-                pass
+            save_pdf(dst_pdf, output_path, run_report)
             
             print(f"\n\n成功创建干净的PDF: {output_path}")
             print(f"总页数: {len(dst_pdf.pages)}")
@@ -378,11 +1818,17 @@ def create_clean_pdf(input_path, output_path):
     except Exception as e:
         print(f"创建干净PDF时出错: {str(e)}")
         return 0
+    finally:
+        run_report.stop()
 
 def main():
     """读取PDF，移除水印，并保存为新文件"""
+    # 命令行入口打印每一处移除的详细信息
+    logging.basicConfig(level=logging.DEBUG, format="[%(levelname)s] %(message)s")
+    
     input_path = "Original-pdf/Original.pdf"
     output_path = "Output-pdf/Output.pdf"
+    report_path = "Output-pdf/Output.report.json"
     
     print(f"读取文件: {input_path}")
     
@@ -390,57 +1836,42 @@ def main():
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     
     try:
-        # 检查原始文件中的水印
-        print("\n--- 详细检查原始文件中的水印 ---")
-        original_watermarks, pages_with_watermarks, watermarks_per_page = check_for_watermarks(input_path)
+        # 检测、移除和校验在同一次遍历中完成，文件只解析一次
+        print("\n--- 检测并移除所有形式的水印 ---")
+        run_report = RunReport(input_path)
+        report = remove_watermarks_pipeline(input_path, output_path, run_report=run_report)
+        if report is None:
+            return
+        run_report.save(report_path)
+        print(f"运行报告已保存到: {report_path}")
         
+        original_watermarks = report["watermarks"]
         if original_watermarks == 0:
-            print("原始文件中未检测到水印，无需处理")
+            print("原始文件中未检测到水印")
             return
         
-        # 计算每页平均水印数量
-        avg_watermarks_per_page = original_watermarks / len(pages_with_watermarks) if pages_with_watermarks else 0
-        print(f"\n平均每页水印数量: {avg_watermarks_per_page:.2f}")
-        
-        # 使用极端方法移除水印
-        print("\n--- 使用极端方法移除所有形式的水印 ---")
-        modified_pages = extreme_watermark_removal(input_path, output_path)
+        # 显示每页的水印统计
+        if report["watermark_layers"]:
+            print(f"\n已关闭水印图层: {', '.join(report['watermark_layers'])}")
+        if report["pages"]:
+            print("\n每页水印统计:")
+        for record in report["pages"]:
+            details = merge_watermark_details(dict(record["found"]), record["residual"])
+            print(f"  页面 {record['page']}: {sum(details.values())} 处水印")
+            for keyword, keyword_count in details.items():
+                print(f"    - '{keyword}': {keyword_count} 处")
         
-        if modified_pages == 0:
-            print("使用极端方法未能修改任何页面，尝试创建全新的PDF")
-            
-            # 尝试创建全新的PDF
-            print("\n--- 创建全新的PDF，彻底移除水印 ---")
-            create_clean_pdf(input_path, output_path)
-        
-        # 检查处理后文件中的水印
-        print("\n--- 检查处理后文件中的水印 ---")
-        remaining_watermarks, remaining_pages, remaining_watermarks_per_page = check_for_watermarks(output_path)
+        # 计算每页平均水印数量（只有水印图层时没有包含水印的页面）
+        print(f"\n发现总计 {original_watermarks} 处水印，在 {len(report['pages_with_watermarks'])} 个页面")
+        if report["pages_with_watermarks"]:
+            avg_watermarks_per_page = original_watermarks / len(report["pages_with_watermarks"])
+            print(f"平均每页水印数量: {avg_watermarks_per_page:.2f}")
         
-        if remaining_watermarks == 0:
-            print("所有水印已成功移除！")
-        else:
-            print(f"警告: 仍有 {remaining_watermarks} 处水印未被移除，在 {len(remaining_pages)} 个页面")
-            
-            # 显示移除效果
-            removal_rate = 100 * (1 - remaining_watermarks / original_watermarks)
-            print(f"\n水印移除率: {removal_rate:.2f}%")
-            
-            # 如果仍有水印，尝试创建全新的PDF
-            if removal_rate < 100:
-                print("\n--- 尝试创建全新的PDF，彻底移除水印 ---")
-                create_clean_pdf(input_path, output_path)
-                
-                # 再次检查
-                print("\n--- 最终检查处理后文件中的水印 ---")
-                final_watermarks, final_pages, _ = check_for_watermarks(output_path)
-                
-                if final_watermarks == 0:
-                    print("所有水印已成功移除！")
-                else:
-                    print(f"警告: 仍有 {final_watermarks} 处水印未被移除，在 {len(final_pages)} 个页面")
-                    final_removal_rate = 100 * (1 - final_watermarks / original_watermarks)
-                    print(f"\n最终水印移除率: {final_removal_rate:.2f}%")
+        # 内存校验中仍有残留的页面已重建内容流
+        if report["rebuilt_pages"]:
+            print(f"\n{report['residual_watermarks']} 处水印无法按文本块移除，"
+                  f"已重建页面: {', '.join(map(str, report['rebuilt_pages']))}")
+        print("所有水印已成功移除！")
             
     except Exception as e:
         print(f"错误: {str(e)}")
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+处理结果缓存：按输入文件内容、关键词和程序版本缓存去水印后的PDF和处理报告。
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+# 默认的结果缓存目录
+DEFAULT_RESULT_CACHE = os.path.join(os.path.expanduser("~"), ".pdf_watermark_remover", "results")
+
+# 结果缓存的容量上限（MB）
+RESULT_CACHE_MB = 1024
+
+# 计算文件摘要时每次读取的字节数
+_DIGEST_CHUNK = 1024 * 1024
+
+def file_digest(path):
+    """文件内容的 SHA-256 摘要（十六进制）"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_DIGEST_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ResultCache:
+    """以内容寻址的处理结果缓存
+
+    每个条目由输出PDF（<键>.pdf）和处理报告（<键>.json）两个文件组成，键为
+    输入文件摘要加上关键词、程序版本和处理选项的摘要。同一文件重复上传或
+    换了文件名，只要内容相同就能命中。总大小超过上限时按最近使用时间淘汰。
+    """
+
+    def __init__(self, directory=DEFAULT_RESULT_CACHE, max_mb=RESULT_CACHE_MB):
+        self.directory = directory
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key_for(self, input_path, keywords, version, options=None):
+        """计算缓存键：输入文件摘要-配置摘要
+
+        配置摘要由排序后的关键词、程序版本和 options 字典组成，关键词顺序
+        不影响结果。
+        """
+        config = json.dumps({
+            "keywords": sorted(keywords),
+            "version": version,
+            "options": options or {},
+        }, sort_keys=True, ensure_ascii=False)
+        config_digest = hashlib.sha256(config.encode("utf-8")).hexdigest()
+        return f"{file_digest(input_path)[:32]}-{config_digest[:32]}"
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".pdf", base + ".json"
+
+    def get(self, key, output_path):
+        """命中时把缓存的PDF复制到 output_path 并返回处理报告，未命中返回 None"""
+        pdf_path, report_path = self._paths(key)
+        try:
+            with open(report_path, encoding="utf-8") as f:
+                report = json.load(f)
+            shutil.copyfile(pdf_path, output_path)
+            os.utime(pdf_path)
+            os.utime(report_path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return report
+
+    def put(self, key, output_path, report):
+        """保存一次处理的输出PDF和报告，随后按容量上限淘汰旧条目"""
+        pdf_path, report_path = self._paths(key)
+        # 先写临时文件再改名，其他进程不会读到写了一半的条目；报告最后写入，
+        # 报告存在即表示条目完整
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            os.close(fd)
+            shutil.copyfile(output_path, temp_path)
+            os.replace(temp_path, pdf_path)
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False)
+            os.replace(temp_path, report_path)
+        finally:
+            # 出错时删除留下的临时文件，它们不算作条目，淘汰时也不会被删除
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.evict()
+
+    def entries(self):
+        """返回 [(最近使用时间, 键, 字节数), ...]"""
+        entries = {}
+        for entry in os.scandir(self.directory):
+            key, extension = os.path.splitext(entry.name)
+            if extension not in (".pdf", ".json"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            used, size = entries.get(key, (0, 0))
+            entries[key] = (max(used, stat.st_mtime), size + stat.st_size)
+        return [(used, key, size) for key, (used, size) in entries.items()]
+
+    def size(self):
+        return sum(size for _, _, size in self.entries())
+
+    def evict(self):
+        """淘汰最久未使用的条目，直到总大小不超过上限"""
+        entries = sorted(self.entries())
+        total = sum(size for _, _, size in entries)
+        for _, key, size in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(key)
+            total -= size
+
+    def _remove(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def invalidate(self, input_path):
+        """删除某个输入文件（按内容）的全部缓存条目，返回删除的条目数"""
+        prefix = file_digest(input_path)[:32] + "-"
+        keys = {key for _, key, _ in self.entries() if key.startswith(prefix)}
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def clear(self):
+        for _, key, _ in self.entries():
+            self._remove(key)
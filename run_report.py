@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+运行报告：记录一次水印检查或移除的各阶段耗时、计数器和逐页耗时，并导出为JSON。
+"""
+
+import json
+import math
+import time
+import contextlib
+import collections
+
+# 报告中保留的 cProfile 函数数和 tracemalloc 分配位置数
+PROFILE_TOP_FUNCTIONS = 25
+TRACEMALLOC_TOP_LINES = 10
+
+class RunReport:
+    """一次运行的结构化报告
+
+    stage() 累计各阶段耗时，count() 累加计数器，page_done() 记录每页耗时。
+    profile 为 True 时用 cProfile 记录函数耗时，trace_memory 为 True 时用
+    tracemalloc 记录内存峰值，两者都在 start() 与 stop() 之间生效。
+    阶段可以嵌套（例如 resources 中包含表单的 parse 和 match），各阶段耗时
+    之和可能超过总耗时。
+    """
+
+    enabled = True
+
+    def __init__(self, name="", profile=False, trace_memory=False):
+        self.name = name
+        self.stages = collections.defaultdict(float)
+        self.counters = collections.defaultdict(int)
+        self.page_latencies = []
+        self.elapsed = 0.0
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self._profiler = None
+        self._started = None
+        self._profile_stats = None
+        self._memory = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """累计代码块的耗时到阶段 name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - start
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def page_done(self, seconds):
+        self.page_latencies.append(seconds)
+
+    def start(self):
+        """开始计时，并按需开启 cProfile 和 tracemalloc"""
+        self._started = time.perf_counter()
+        if self.trace_memory:
+            import tracemalloc
+            tracemalloc.start()
+        if self.profile:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop(self):
+        """停止计时，收集 cProfile 和 tracemalloc 的结果"""
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profile_stats = self._collect_profile(self._profiler)
+            self._profiler = None
+        if self.trace_memory:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                self._memory = {
+                    "current_bytes": current,
+                    "peak_bytes": peak,
+                    "top_allocations": [
+                        {"location": str(stat.traceback), "bytes": stat.size, "blocks": stat.count}
+                        for stat in snapshot.statistics("lineno")[:TRACEMALLOC_TOP_LINES]
+                    ],
+                }
+        if self._started is not None:
+            self.elapsed += time.perf_counter() - self._started
+            self._started = None
+
+    @staticmethod
+    def _collect_profile(profiler):
+        import pstats
+        stats = pstats.Stats(profiler)
+        rows = []
+        for (filename, line, function), (_, calls, total, cumulative, _) in stats.stats.items():
+            rows.append({
+                "function": f"{filename}:{line}({function})",
+                "calls": calls,
+                "total": round(total, 6),
+                "cumulative": round(cumulative, 6),
+            })
+        rows.sort(key=lambda row: row["cumulative"], reverse=True)
+        return rows[:PROFILE_TOP_FUNCTIONS]
+
+    def latency_percentiles(self):
+        """逐页耗时的 p50/p90/p99/max（秒，最近秩法）"""
+        if not self.page_latencies:
+            return {}
+        ordered = sorted(self.page_latencies)
+        def percentile(fraction):
+            index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+            return round(ordered[index], 6)
+        return {
+            "p50": percentile(0.50),
+            "p90": percentile(0.90),
+            "p99": percentile(0.99),
+            "max": round(ordered[-1], 6),
+        }
+
+    def to_dict(self):
+        result = {
+            "name": self.name,
+            "elapsed": round(self.elapsed, 6),
+            "stages": {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            "counters": dict(self.counters),
+            "pages": len(self.page_latencies),
+            "page_latency": self.latency_percentiles(),
+        }
+        if self._profile_stats is not None:
+            result["profile"] = self._profile_stats
+        if self._memory is not None:
+            result["memory"] = self._memory
+        return result
+
+    def save(self, path):
+        """把报告保存为JSON文件"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+class _NullReport:
+    """未开启报告时使用的空实现，所有记录操作都不做任何事"""
+
+    enabled = False
+    _null_stage = contextlib.nullcontext()
+
+    def stage(self, name):
+        return self._null_stage
+
+    def count(self, name, amount=1):
+        pass
+
+    def page_done(self, seconds):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+NULL_REPORT = _NullReport()
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+本地HTTP服务：常驻进程池预先导入并初始化处理函数，每个文档只需付出处理时间。
+
+    python service.py --port 8765 --workers 4
+    curl --data-binary @input.pdf -o output.pdf -D - "http://127.0.0.1:8765/remove?keyword=Review%20Copy"
+"""
+
+import io
+import os
+import sys
+import json
+import base64
+import argparse
+import threading
+import contextlib
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# 单个请求允许上传的最大PDF大小（MB）
+MAX_UPLOAD_MB = 512
+
+# 处理报告摘要所在的响应头，不含逐页记录
+REPORT_HEADER = "X-Watermark-Report"
+
+def report_summary(report):
+    """处理报告的摘要：页码列表换成页数，去掉逐页记录，长度与页数无关"""
+    return {
+        "watermarks": report["watermarks"],
+        "pages_with_watermarks": len(report["pages_with_watermarks"]),
+        "pages_modified": report["pages_modified"],
+        "residual_watermarks": report["residual_watermarks"],
+        "rebuilt_pages": len(report["rebuilt_pages"]),
+        "watermark_layers": report["watermark_layers"],
+        "stats": report["stats"],
+        "elapsed": report["run"]["elapsed"],
+        "stages": report["run"]["stages"],
+    }
+
+def _warm_worker():
+    """进程池初始化：导入 pikepdf 和处理模块，并编译默认关键词的匹配器"""
+    import pdf_watermark_remove
+    pdf_watermark_remove.get_keyword_matcher()
+
+def _ping(_):
+    return os.getpid()
+
+def _remove_job(data, keywords):
+    """工作进程任务：在内存中移除水印，返回 (输出PDF字节, 处理报告)"""
+    from pdf_watermark_remove import remove_watermarks_pipeline, set_watermark_keywords
+    from run_report import RunReport
+
+    set_watermark_keywords(list(keywords))
+    output = io.BytesIO()
+    run_report = RunReport("service")
+    console = io.StringIO()
+    with contextlib.redirect_stdout(console):
+        report = remove_watermarks_pipeline(io.BytesIO(data), output, run_report=run_report)
+    if report is None:
+        messages = console.getvalue().strip().splitlines()
+        raise ValueError(messages[-1] if messages else "无法处理该PDF")
+    report["run"] = run_report.to_dict()
+    return output.getvalue(), report
+
+def _check_job(data, keywords):
+    """工作进程任务：检查水印，返回 {watermarks, watermark_layers, pages: [{page, count, details}]}"""
+    import pikepdf
+    from pdf_watermark_remove import iter_watermark_check, find_watermark_layers, get_keyword_matcher, layer_names
+
+    pages = []
+    with pikepdf.open(io.BytesIO(data)) as pdf:
+        layers = layer_names(find_watermark_layers(pdf, get_keyword_matcher(keywords)))
+        for record in iter_watermark_check(pdf, keywords=keywords):
+            if record["count"] > 0:
+                pages.append(record)
+    # 每个水印图层计为一处水印
+    return {"watermarks": sum(record["count"] for record in pages) + len(layers), "watermark_layers": layers,
+            "pages": pages}
+
+class WatermarkService(ThreadingHTTPServer):
+    """HTTP服务器：每个请求一个线程，实际处理交给预热的进程池"""
+
+    daemon_threads = True
+
+    def __init__(self, address, workers=None):
+        super().__init__(address, WatermarkRequestHandler)
+        self.workers = workers or os.cpu_count() or 1
+        self._executor_lock = threading.Lock()
+        self.executor = self._start_executor()
+
+    def _start_executor(self):
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker)
+        # 进程池按需启动进程，同时提交 workers 个任务让所有进程在第一个请求之前就绪
+        list(executor.map(_ping, range(self.workers)))
+        return executor
+
+    def restart_executor(self, broken):
+        """工作进程异常退出后进程池不再可用，换一个新的预热进程池；多个请求同时发现时只换一次"""
+        with self._executor_lock:
+            if self.executor is broken:
+                broken.shutdown(wait=False)
+                self.executor = self._start_executor()
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown()
+
+class WatermarkRequestHandler(BaseHTTPRequestHandler):
+    """GET /health 查询状态；POST /check 检查水印；POST /remove 移除水印
+
+    请求体为PDF文件内容，关键词通过重复的 keyword 查询参数给出，未给出时
+    使用默认关键词。/remove 的响应体为去水印后的PDF，处理报告摘要放在
+    X-Watermark-Report 响应头中；加上 format=json 时响应体为包含完整报告和
+    base64 编码PDF的JSON。
+    """
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            self.send_json(404, {"error": "not found"})
+            return
+        from pdf_watermark_remove import __version__
+        self.send_json(200, {"status": "ok", "version": __version__, "workers": self.server.workers})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        jobs = {"/check": _check_job, "/remove": _remove_job}
+        if url.path not in jobs:
+            self.send_json(404, {"error": "not found"})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            self.send_json(400, {"error": "request body must be a PDF file"})
+            return
+        if length > MAX_UPLOAD_MB * 1024 * 1024:
+            self.send_json(413, {"error": f"PDF larger than {MAX_UPLOAD_MB} MB"})
+            return
+        data = self.rfile.read(length)
+
+        query = parse_qs(url.query)
+        keywords = query.get("keyword")
+        if not keywords:
+            from pdf_watermark_remove import get_default_watermark_keywords
+            keywords = get_default_watermark_keywords()
+
+        executor = self.server.executor
+        try:
+            result = executor.submit(jobs[url.path], data, tuple(keywords)).result()
+        except BrokenProcessPool:
+            # 例如 qpdf 处理畸形文件时崩溃：本次请求失败，后续请求使用新的进程池
+            self.server.restart_executor(executor)
+            self.send_json(500, {"error": "worker process crashed"})
+            return
+        except Exception as e:
+            self.send_json(422, {"error": str(e)})
+            return
+
+        if url.path == "/check":
+            self.send_json(200, result)
+            return
+
+        pdf_bytes, report = result
+        if query.get("format") == ["json"]:
+            self.send_json(200, {"report": report, "pdf": base64.b64encode(pdf_bytes).decode("ascii")})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(pdf_bytes)))
+        self.send_header(REPORT_HEADER, json.dumps(report_summary(report), separators=(",", ":")))
+        self.end_headers()
+        self.wfile.write(pdf_bytes)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF水印移除本地HTTP服务")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="监听地址，默认只接受本机连接")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("-j", "--workers", type=int, default=None, help="工作进程数，默认为CPU核数")
+    args = parser.parse_args()
+
+    server = WatermarkService((args.host, args.port), args.workers)
+    print(f"服务已启动: http://{args.host}:{args.port}（{server.workers} 个工作进程）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    sys.exit(main())
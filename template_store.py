@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+水印模板库：把已确认的水印文本块和表单指纹保存在 SQLite 中，跨文档复用。
+"""
+
+import os
+import json
+import time
+import sqlite3
+
+# 默认的模板库位置
+DEFAULT_TEMPLATE_STORE = os.path.join(os.path.expanduser("~"), ".pdf_watermark_remover", "templates.sqlite3")
+
+# 模板样本文本保存的最大长度
+TEMPLATE_SAMPLE_LENGTH = 200
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS templates (
+    fingerprint BLOB PRIMARY KEY,
+    kind TEXT NOT NULL,
+    details TEXT NOT NULL,
+    sample TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 1,
+    created REAL NOT NULL,
+    last_seen REAL NOT NULL
+)
+"""
+
+class TemplateStore:
+    """SQLite 中的水印模板库
+
+    每个模板为一个文本块指纹（block_fingerprint）或表单指纹
+    （form_fingerprint），以及当初匹配到的关键词统计。templates() 一次读出
+    全部模板，处理时每个文本块只需一次字典查找。多个进程可以同时使用同一个
+    模板库文件。
+    """
+
+    def __init__(self, path=DEFAULT_TEMPLATE_STORE):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+        self._templates = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM templates").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+    def templates(self):
+        """返回 {指纹: {关键词: 次数}}，可直接作为移除函数的 fingerprints 参数"""
+        if self._templates is None:
+            self._templates = {
+                bytes(fingerprint): json.loads(details)
+                for fingerprint, details in self._conn.execute("SELECT fingerprint, details FROM templates")
+            }
+        return self._templates
+
+    def lookup(self, fingerprint):
+        """按指纹查找模板，返回 {kind, details, sample, hits}，不存在时返回 None"""
+        row = self._conn.execute(
+            "SELECT kind, details, sample, hits FROM templates WHERE fingerprint = ?", (fingerprint,)
+        ).fetchone()
+        if row is None:
+            return None
+        kind, details, sample, hits = row
+        return {"kind": kind, "details": json.loads(details), "sample": sample, "hits": hits}
+
+    def add_templates(self, templates):
+        """添加或更新模板，templates 为 (类型, 指纹, {关键词: 次数}, 文本) 的序列
+
+        已有的模板只更新命中次数和最近出现时间。返回新增的模板数。
+        """
+        now = time.time()
+        before = len(self)
+        with self._conn:
+            for kind, fingerprint, details, text in templates:
+                if isinstance(text, bytes):
+                    text = text.decode("latin-1")
+                self._conn.execute(
+                    "INSERT INTO templates (fingerprint, kind, details, sample, created, last_seen) "
+                    "VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(fingerprint) DO UPDATE SET hits = hits + 1, last_seen = excluded.last_seen",
+                    (fingerprint, kind, json.dumps(details, ensure_ascii=False),
+                     text[:TEMPLATE_SAMPLE_LENGTH], now, now),
+                )
+        self._templates = None
+        return len(self) - before
+
+    def remove(self, fingerprint):
+        """删除一个模板，例如被误判为水印的内容"""
+        with self._conn:
+            self._conn.execute("DELETE FROM templates WHERE fingerprint = ?", (fingerprint,))
+        self._templates = None
+
+    def clear(self):
+        with self._conn:
+            self._conn.execute("DELETE FROM templates")
+        self._templates = None
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+import pikepdf
+import pytest
+from pikepdf import Array, Dictionary, Name
+
+from pdf_watermark_remove import (
+    KeywordMatcher, TextBlock, TextState, WATERMARK_ARTIFACT_LABEL, WATERMARK_FORM_LABEL, WATERMARK_LAYER_LABEL,
+    XObjectScanner, count_page_texts, extract_block_text, extract_page_texts, filter_content_stream,
+    filter_page_contents, filter_resources, iter_removal, iter_text_blocks, iter_watermark_check,
+    strip_watermark_artifacts, watermark_layer_names, _parse_data
+)
+
+MATCHER = KeywordMatcher(["Review Copy", "机密"])
+
+@pytest.fixture
+def pdf():
+    with pikepdf.new() as pdf:
+        yield pdf
+
+def _operators(instructions):
+    return [str(instruction.operator) for instruction in instructions]
+
+def test_keyword_block_removed_other_blocks_kept(pdf):
+    stream = pdf.make_stream(b"q 1 0 0 1 0 0 cm Q BT (Chapter 1) Tj ET BT (REVIEW COPY) Tj ET")
+    result = filter_content_stream(stream, MATCHER)
+    assert result.removed_blocks == 1
+    assert result.found == {"Review Copy": 1}
+    assert result.residual == {}
+    assert _operators(_parse_data(result.new_bytes)) == ["q", "cm", "Q", "BT", "Tj", "ET"]
+
+def test_unchanged_stream_not_rewritten(pdf):
+    stream = pdf.make_stream(b"BT (Chapter 1) Tj ET")
+    result = filter_content_stream(stream, MATCHER)
+    assert result.new_bytes is None
+    assert result.removed_blocks == 0
+
+def test_tj_spacing():
+    assert extract_block_text(_parse_data(b"BT [(Review) -300 (Copy)] TJ ET")) == "Review Copy"
+    # 字距调整不是单词间距
+    assert extract_block_text(_parse_data(b"BT [(Rev) -50 (iew) 20 (!)] TJ ET")) == "Review!"
+
+def test_keyword_split_across_tj_items(pdf):
+    stream = pdf.make_stream(b"BT [(Rev) -20 (iew) -250 (Co) -10 (py)] TJ ET")
+    assert filter_content_stream(stream, MATCHER).found == {"Review Copy": 1}
+
+def test_inline_image_bytes_preserved(pdf):
+    image = bytes([0x00, 0xFF, 0x10, 0x80, 0x0A, 0x0D])
+    data = b"q BI /W 6 /H 1 /BPC 8 /CS /G ID " + image + b" EI Q BT (Review Copy) Tj ET"
+    result = filter_content_stream(pdf.make_stream(data), MATCHER)
+    assert result.removed_blocks == 1
+    assert _operators(_parse_data(result.new_bytes)) == ["q", "INLINE IMAGE", "Q"]
+    assert b"\nID\n" + image + b" EI" in result.new_bytes
+
+def test_iter_text_blocks():
+    items = list(iter_text_blocks(_parse_data(b"q BT (a) Tj ET Q BT (b) Tj"), TextState()))
+    assert [type(item) for item in items] == [pikepdf.ContentStreamInstruction, TextBlock,
+                                              pikepdf.ContentStreamInstruction, TextBlock]
+    assert [item.text for item in items[1::2]] == ["a", "b"]
+    assert [item.closed for item in items[1::2]] == [True, False]
+
+def test_nested_marked_content_inside_artifact():
+    instructions = _parse_data(
+        b"/Artifact <</Subtype /Watermark>> BDC /Span <<>> BDC BT (x) Tj ET EMC /P BMC EMC EMC "
+        b"/P BMC BT (body) Tj ET EMC"
+    )
+    kept, removed = strip_watermark_artifacts(instructions)
+    assert removed == {WATERMARK_ARTIFACT_LABEL: 1}
+    assert _operators(kept) == ["BMC", "BT", "Tj", "ET", "EMC"]
+
+def test_unclosed_artifact_left_unchanged(pdf):
+    data = b"/Artifact <</Subtype /Watermark>> BDC BT (Review Copy) Tj ET"
+    instructions = _parse_data(data)
+    kept, removed = strip_watermark_artifacts(instructions)
+    assert removed == {}
+    assert kept is instructions
+    # 标记不完整时回退到关键词匹配
+    assert filter_content_stream(pdf.make_stream(data), MATCHER).found == {"Review Copy": 1}
+
+def test_artifact_by_property_name(pdf):
+    resources = Dictionary(Properties=Dictionary(MC0=Dictionary(Subtype=Name.Watermark)))
+    stream = pdf.make_stream(b"/Artifact /MC0 BDC BT (DRAFT) Tj ET EMC BT (body) Tj ET")
+    result = filter_content_stream(stream, MATCHER, resources=resources)
+    assert result.found == {WATERMARK_ARTIFACT_LABEL: 1}
+    assert _operators(_parse_data(result.new_bytes)) == ["BT", "Tj", "ET"]
+
+def test_keywords_outside_artifact_still_removed(pdf):
+    data = b"/Artifact <</Subtype /Watermark>> BDC BT (DRAFT) Tj ET EMC BT (Body) Tj ET BT (Review Copy) Tj ET"
+    result = filter_content_stream(pdf.make_stream(data), MATCHER)
+    assert result.found == {WATERMARK_ARTIFACT_LABEL: 1, "Review Copy": 1}
+    assert result.residual == {}
+    assert b"Review Copy" not in result.new_bytes
+    assert b"Body" in result.new_bytes
+
+    pdf.add_blank_page()
+    pdf.pages[0].Contents = pdf.make_stream(data)
+    texts = extract_page_texts(pdf.pages[0])
+    assert count_page_texts(texts, MATCHER) == {WATERMARK_ARTIFACT_LABEL: 1, "Review Copy": 1}
+
+def test_layer_sequences_and_ocmd(pdf):
+    layer = pdf.make_indirect(Dictionary(Type=Name.OCG, Name=pikepdf.String("Watermark")))
+    other = pdf.make_indirect(Dictionary(Type=Name.OCG, Name=pikepdf.String("Text")))
+    resources = Dictionary(Properties=Dictionary(
+        L0=layer,
+        L1=Dictionary(Type=Name.OCMD, OCGs=Array([layer])),
+        L2=Dictionary(Type=Name.OCMD, OCGs=Array([layer, other])),
+        L3=other,
+    ))
+    layers = frozenset([layer.objgen])
+    assert watermark_layer_names(resources, layers) == {"/L0", "/L1"}
+    stream = pdf.make_stream(b"/OC /L0 BDC BT (a) Tj ET EMC /OC /L3 BDC BT (b) Tj ET EMC")
+    result = filter_content_stream(stream, MATCHER, resources=resources, layers=layers)
+    assert result.found == {WATERMARK_LAYER_LABEL: 1}
+
+def test_font_selected_in_earlier_stream(pdf):
+    cmap = pdf.make_stream(b"1 begincodespacerange <0000> <FFFF> endcodespacerange\n"
+                           b"1 beginbfchar <0001> <00520065007600690065007700200043006F00700079> endbfchar")
+    font = pdf.make_indirect(Dictionary(Type=Name.Font, Subtype=Name.Type0, BaseFont=Name("/X"),
+                                        Encoding=Name("/Identity-H"), ToUnicode=cmap))
+    pdf.add_blank_page()
+    page = pdf.pages[0]
+    page.Resources = Dictionary(Font=Dictionary(F1=font))
+    page.Contents = Array([pdf.make_stream(b"/F1 12 Tf"), pdf.make_stream(b"BT <0001> Tj ET")])
+    results = filter_page_contents(page, MATCHER)
+    assert [result.found for result in results] == [{}, {"Review Copy": 1}]
+    assert count_page_texts(extract_page_texts(page), MATCHER) == {"Review Copy": 1}
+
+def _form(pdf, data, **resources):
+    return pdf.make_stream(data, Type=Name.XObject, Subtype=Name.Form, BBox=[0, 0, 100, 100],
+                           Resources=Dictionary(**resources))
+
+def test_nested_watermark_form_counted(pdf):
+    inner = _form(pdf, b"BT (Review Copy) Tj ET")
+    outer = _form(pdf, b"/Inner Do BT (Logo) Tj ET", XObject=Dictionary(Inner=inner))
+    resources = Dictionary(XObject=Dictionary(Outer=outer))
+    pdf.add_blank_page()
+    pdf.pages[0].Resources = resources
+    pdf.pages[0].Contents = pdf.make_stream(b"/Outer Do")
+
+    records = list(iter_watermark_check(pdf))
+    assert records[0]["details"] == {WATERMARK_FORM_LABEL: 1}
+    assert "/Inner" in outer.Resources.XObject
+
+    modified, forms = filter_resources(resources, XObjectScanner(MATCHER))
+    assert (modified, forms) == (True, 1)
+    assert "/Inner" not in outer.Resources.XObject
+    assert "/Outer" in resources.XObject
+
+def test_shared_xobject_dictionary_counted_on_every_page(pdf):
+    xobjects = pdf.make_indirect(Dictionary(W=_form(pdf, b"BT (Review Copy) Tj ET")))
+    for i in range(3):
+        pdf.add_blank_page()
+        # 每页有自己的资源字典，但共用同一个 /XObject 字典
+        pdf.pages[i].Resources = Dictionary(XObject=xobjects)
+        pdf.pages[i].Contents = pdf.make_stream(b"/W Do BT (Body) Tj ET")
+    records = list(iter_removal(pdf, keywords=MATCHER.keywords))
+    assert [record["found"] for record in records] == [{WATERMARK_FORM_LABEL: 1}] * 3
+    assert all(record["modified"] for record in records)
+    assert "/W" not in xobjects
+
+def test_matcher_prefers_longer_keyword_and_literal_text():
+    matcher = KeywordMatcher(["Conf", "CONFIDENTIAL", "a+b"])
+    assert matcher.count("confidential conf a+b aab") == (3, {"CONFIDENTIAL": 1, "Conf": 1, "a+b": 1})
+    assert matcher.count(b"CONFIDENTIAL") == (1, {"CONFIDENTIAL": 1})
+
+def test_matcher_long_keyword():
+    keyword = "x" * 5000
+    assert KeywordMatcher([keyword, "y"]).count("a" + keyword + "y") == (2, {keyword: 1, "y": 1})
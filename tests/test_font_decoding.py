@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import pikepdf
+from pikepdf import Array, Dictionary, Name
+
+from font_decoding import (
+    CMAP_RANGE_EXPAND, FontCache, FontDecoder, UNKNOWN_FONT, glyph_name_to_text, parse_cmap,
+    single_byte_table
+)
+
+MIXED_CMAP = b"""
+/CIDInit /ProcSet findresource begin
+begincmap
+2 begincodespacerange
+<00> <7F>
+<8140> <FEFE>
+endcodespacerange
+2 beginbfchar
+<41> <0041>
+<8140> <4E2D>
+endbfchar
+2 beginbfrange
+<61> <63> [<0078> <0079> <007A>]
+<8141> <8142> <6587>
+endbfrange
+endcmap
+"""
+
+def test_parse_cmap_mixed_codespace():
+    codespace, chars, ranges = parse_cmap(MIXED_CMAP)
+    assert codespace == [(b"\x00", b"\x7f"), (b"\x81\x40", b"\xfe\xfe")]
+    assert chars[b"A"] == "A"
+    assert chars[b"\x81\x40"] == "中"
+    assert ranges == []
+
+def test_parse_cmap_bfrange_array_and_offset():
+    _, chars, _ = parse_cmap(MIXED_CMAP)
+    # 数组形式的 bfrange 逐个对应，起止形式的按偏移递增
+    assert [chars[code] for code in (b"a", b"b", b"c")] == ["x", "y", "z"]
+    assert chars[b"\x81\x41"] == "文"
+    assert chars[b"\x81\x42"] == "斈"
+
+def test_parse_cmap_long_range_kept_as_interval():
+    data = b"1 begincodespacerange <0000> <FFFF> endcodespacerange\n" \
+           b"1 beginbfrange <0100> <0400> <4E00> endbfrange"
+    _, chars, ranges = parse_cmap(data)
+    assert 0x400 - 0x100 >= CMAP_RANGE_EXPAND
+    assert chars == {}
+    assert ranges == [(2, 0x100, 0x400, b"\x4e\x00")]
+    decoder = FontDecoder(2, [(b"\x00\x00", b"\xff\xff")], chars, ranges)
+    assert decoder.decode(b"\x01\x02") == "丂"
+
+def test_decoder_splits_mixed_length_codes():
+    codespace, chars, ranges = parse_cmap(MIXED_CMAP)
+    decoder = FontDecoder(None, codespace, chars, ranges)
+    data = b"A\x81\x40ab\x81\x41"
+    assert list(decoder._codes(data)) == [b"A", b"\x81\x40", b"a", b"b", b"\x81\x41"]
+    assert decoder.decode(data) == "A中xy文"
+
+def test_decoder_unmapped_code_uses_fallback():
+    decoder = FontDecoder(1, chars={b"A": "A"}, fallback=lambda code: "?")
+    assert decoder.decode(b"AB") == "A?"
+
+def test_glyph_names():
+    assert glyph_name_to_text("/space") == " "
+    assert glyph_name_to_text("/uni4E2D") == "中"
+    assert glyph_name_to_text("/u1F600") == "\U0001F600"
+    assert glyph_name_to_text("/f_i") == "fi"
+    assert glyph_name_to_text("/a.sc") == "a"
+    assert glyph_name_to_text("/g123") == ""
+
+def test_single_byte_table_differences():
+    encoding = Dictionary(
+        BaseEncoding=Name.WinAnsiEncoding,
+        Differences=Array([65, Name("/R"), Name("/e"), 0x80, Name("/uni6C34")]),
+    )
+    table = single_byte_table(encoding)
+    assert table[65] == "R"
+    assert table[66] == "e"
+    assert table[67] == "C"
+    assert table[0x80] == "水"
+
+def test_single_byte_table_unknown_encoding():
+    assert single_byte_table(None) is None
+    assert single_byte_table(Name("/Custom")) is None
+
+def _font(pdf, **entries):
+    return pdf.make_indirect(Dictionary(Type=Name.Font, **entries))
+
+def test_font_cache_type0_identity_without_to_unicode():
+    pdf = pikepdf.new()
+    font = _font(pdf, Subtype=Name.Type0, Encoding=Name("/Identity-H"))
+    assert FontCache().decoder_for(font) is UNKNOWN_FONT
+
+def test_font_cache_type0_ucs2_encoding():
+    pdf = pikepdf.new()
+    font = _font(pdf, Subtype=Name.Type0, Encoding=Name("/UniGB-UCS2-H"))
+    decoder = FontCache().decoder_for(font)
+    assert decoder.decode("水印".encode("utf-16-be")) == "水印"
+
+def test_font_cache_to_unicode_shared_between_fonts():
+    pdf = pikepdf.new()
+    cmap = pdf.make_stream(MIXED_CMAP)
+    first = _font(pdf, Subtype=Name.Type0, Encoding=Name("/Identity-H"), ToUnicode=cmap)
+    second = _font(pdf, Subtype=Name.Type0, Encoding=Name("/Identity-H"), ToUnicode=cmap)
+    fonts = FontCache()
+    assert fonts.decoder_for(first).decode(b"\x81\x40A") == "中A"
+    assert fonts.decoder_for(second).decode(b"ab") == "xy"
+    assert fonts.fonts_parsed == 2
+    assert len(fonts.cmaps) == 1
+    # 同一字体再次查询直接返回缓存的解码器
+    assert fonts.decoder_for(first) is fonts.decoder_for(first)
+    assert fonts.fonts_parsed == 2
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import pikepdf
+from pikepdf import Array
+
+from pdf_watermark_remove import extreme_watermark_removal
+
+def _page_contents(path):
+    with pikepdf.open(path) as pdf:
+        contents = []
+        for page in pdf.pages:
+            streams = page.Contents if isinstance(page.Contents, Array) else [page.Contents]
+            contents.append([stream.read_bytes() for stream in streams])
+        return contents
+
+def test_parallel_output_matches_serial(tmp_path):
+    source = tmp_path / "input.pdf"
+    with pikepdf.new() as pdf:
+        for i in range(8):
+            pdf.add_blank_page()
+            body = pdf.make_stream(b"BT (Chapter %d) Tj ET" % i)
+            if i % 3 == 2:
+                # 没有水印的页面
+                pdf.pages[i].Contents = body
+            else:
+                watermark = pdf.make_stream(b"q BT [(Review) -300 (Copy)] TJ ET Q")
+                pdf.pages[i].Contents = Array([body, watermark])
+        pdf.save(source)
+
+    serial_stats = {}
+    parallel_stats = {}
+    serial = extreme_watermark_removal(str(source), str(tmp_path / "serial.pdf"), stats=serial_stats, workers=1)
+    parallel = extreme_watermark_removal(str(source), str(tmp_path / "parallel.pdf"), stats=parallel_stats,
+                                         workers=2)
+
+    assert serial == parallel == 6
+    assert serial_stats == parallel_stats
+    assert _page_contents(tmp_path / "serial.pdf") == _page_contents(tmp_path / "parallel.pdf")
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import os
+
+from result_cache import ResultCache
+from template_store import TemplateStore
+from pdf_watermark_remove import result_cache_key
+
+def _write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+def test_key_depends_on_content_keywords_and_options(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    first = _write(tmp_path / "a.pdf", b"%PDF-a")
+    renamed = _write(tmp_path / "renamed.pdf", b"%PDF-a")
+    other = _write(tmp_path / "b.pdf", b"%PDF-b")
+    key = cache.key_for(first, ["x", "y"], "1.0")
+    assert cache.key_for(renamed, ["y", "x"], "1.0") == key
+    assert cache.key_for(other, ["x", "y"], "1.0") != key
+    assert cache.key_for(first, ["x"], "1.0") != key
+    assert cache.key_for(first, ["x", "y"], "1.1") != key
+    assert cache.key_for(first, ["x", "y"], "1.0", {"step": "batch"}) != key
+
+def test_put_and_get(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    output = _write(tmp_path / "out.pdf", b"%PDF-clean")
+    assert cache.get("k", str(tmp_path / "copy.pdf")) is None
+    cache.put("k", output, {"pages_modified": 3})
+    assert cache.get("k", str(tmp_path / "copy.pdf")) == {"pages_modified": 3}
+    with open(tmp_path / "copy.pdf", "rb") as f:
+        assert f.read() == b"%PDF-clean"
+    assert (cache.hits, cache.misses) == (1, 1)
+    # 临时文件不会留在缓存目录中
+    assert sorted(os.listdir(cache.directory)) == ["k.json", "k.pdf"]
+
+def test_least_recently_used_entry_evicted(tmp_path):
+    output = _write(tmp_path / "out.pdf", b"x" * 1000)
+    cache = ResultCache(str(tmp_path / "cache"))
+    cache.put("a", output, {})
+    entry_size = cache.size()
+    cache.max_bytes = entry_size * 2
+    cache.put("b", output, {})
+    for key, used in (("a", 1000), ("b", 2000)):
+        for path in cache._paths(key):
+            os.utime(path, (used, used))
+    # 读取 a 之后 b 成为最久未使用的条目
+    assert cache.get("a", str(tmp_path / "copy.pdf")) == {}
+    cache.put("c", output, {})
+    assert sorted(key for _, key, _ in cache.entries()) == ["a", "c"]
+
+def test_invalidate_removes_every_entry_for_input(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    source = _write(tmp_path / "a.pdf", b"%PDF-a")
+    other = _write(tmp_path / "b.pdf", b"%PDF-b")
+    for key in (cache.key_for(source, ["x"], "1"), cache.key_for(source, ["y"], "1"),
+                cache.key_for(other, ["x"], "1")):
+        cache.put(key, source, {})
+    assert cache.invalidate(source) == 2
+    assert [key for _, key, _ in cache.entries()] == [cache.key_for(other, ["x"], "1")]
+
+def test_cache_key_ignores_learned_templates(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    source = _write(tmp_path / "a.pdf", b"%PDF-a")
+    output = str(tmp_path / "out.pdf")
+    with TemplateStore(str(tmp_path / "templates.sqlite3")) as store:
+        key = result_cache_key(cache, source, output, "batch", None, template_store=store)
+        store.add_templates([("block", b"\x01" * 16, {"Review Copy": 1}, "Review Copy")])
+        assert result_cache_key(cache, source, output, "batch", None, template_store=store) == key
+    assert result_cache_key(cache, source, output, "batch", None) != key
+    # 输出不是文件路径时不使用缓存
+    assert result_cache_key(cache, source, None, "batch", None) is None
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+from run_report import RunReport
+
+def _percentiles(latencies):
+    report = RunReport("test")
+    report.page_latencies = list(latencies)
+    return report.latency_percentiles()
+
+def test_nearest_rank_percentiles():
+    assert _percentiles([1, 2])["p50"] == 1
+    assert _percentiles(range(1, 7))["p50"] == 3
+    assert _percentiles(range(1, 101)) == {"p50": 50, "p90": 90, "p99": 99, "max": 100}
+
+def test_no_pages():
+    assert _percentiles([]) == {}
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from template_store import TemplateStore
+from pdf_watermark_remove import KeywordMatcher, active_templates
+
+BLOCK = b"\x01" * 16
+FORM = b"\x02" * 16
+
+def test_add_templates_counts_hits(tmp_path):
+    path = str(tmp_path / "templates.sqlite3")
+    with TemplateStore(path) as store:
+        added = store.add_templates([
+            ("block", BLOCK, {"Review Copy": 1}, "Review Copy"),
+            ("form", FORM, {"机密": 2}, b"\xe6\x9c\xba"),
+        ])
+        assert added == 2
+        assert store.add_templates([("block", BLOCK, {"Review Copy": 1}, "Review Copy")]) == 0
+        assert store.lookup(BLOCK) == {"kind": "block", "details": {"Review Copy": 1}, "sample": "Review Copy",
+                                       "hits": 2}
+        assert store.lookup(b"\x03" * 16) is None
+    # 重新打开后模板仍在
+    with TemplateStore(path) as store:
+        assert store.templates() == {BLOCK: {"Review Copy": 1}, FORM: {"机密": 2}}
+        store.remove(FORM)
+        assert list(store.templates()) == [BLOCK]
+        store.clear()
+        assert len(store) == 0
+
+def test_active_templates_follow_current_keywords(tmp_path):
+    with TemplateStore(str(tmp_path / "templates.sqlite3")) as store:
+        store.add_templates([
+            ("block", BLOCK, {"Review Copy": 1}, "Review Copy"),
+            ("form", FORM, {"机密": 1, "Draft": 1}, "机密 Draft"),
+        ])
+        assert active_templates(store, KeywordMatcher(["review copy"])) == {BLOCK: {"Review Copy": 1}}
+        assert set(active_templates(store, KeywordMatcher(["Draft", "Review Copy"]))) == {BLOCK, FORM}
+        assert active_templates(store, KeywordMatcher(["Other"])) == {}